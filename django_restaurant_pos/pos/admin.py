@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Category, MenuItem, Table, Order, OrderItem, Payment
+from .models import (
+    Category, MenuItem, Table, Order, OrderItem, Payment, OrderEvent, DailySalesRollup, Task, StockShard,
+    Reservation, DayClose,
+)
 
 
 @admin.register(Category)
@@ -13,6 +16,7 @@ class CategoryAdmin(admin.ModelAdmin):
 class MenuItemAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'price', 'is_available', 'created_at']
     list_filter = ['category', 'is_available', 'created_at']
+    list_select_related = ['category']
     search_fields = ['name', 'description']
     list_editable = ['price', 'is_available']
 
@@ -38,6 +42,7 @@ class OrderItemInline(admin.TabularInline):
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['order_number', 'table', 'customer_name', 'status', 'total', 'created_at']
     list_filter = ['status', 'created_at', 'table']
+    list_select_related = ['table']
     search_fields = ['order_number', 'customer_name']
     readonly_fields = ['order_number', 'subtotal', 'tax_amount', 'total']
     inlines = [OrderItemInline]
@@ -47,4 +52,69 @@ class OrderAdmin(admin.ModelAdmin):
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ['order', 'amount', 'method', 'processed_by', 'processed_at']
     list_filter = ['method', 'processed_at']
-    readonly_fields = ['processed_at']
\ No newline at end of file
+    list_select_related = ['order', 'processed_by']
+    readonly_fields = ['processed_at']
+
+
+@admin.register(OrderEvent)
+class OrderEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'event_type', 'order_id', 'table_id', 'created_at']
+    list_filter = ['event_type', 'created_at']
+    search_fields = ['order_id']
+    
+    # The event log is append-only
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'orders_created', 'orders_paid', 'orders_cancelled', 'items_sold', 'revenue']
+    readonly_fields = ['last_event_id', 'updated_at']
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'location', 'run_after', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'dedupe_key']
+    readonly_fields = ['attempts', 'worker', 'last_error', 'created_at', 'started_at', 'finished_at']
+
+
+@admin.register(StockShard)
+class StockShardAdmin(admin.ModelAdmin):
+    list_display = ['menu_item', 'shard', 'quantity']
+    list_filter = ['menu_item__category']
+    list_select_related = ['menu_item']
+
+
+@admin.register(Reservation)
+class ReservationAdmin(admin.ModelAdmin):
+    list_display = ['customer_name', 'party_size', 'table', 'start', 'end', 'status']
+    list_filter = ['status', 'start']
+    search_fields = ['customer_name', 'phone']
+    list_select_related = ['table']
+    date_hierarchy = 'start'
+
+
+@admin.register(DayClose)
+class DayCloseAdmin(admin.ModelAdmin):
+    list_display = ['date', 'orders', 'sales', 'tax', 'mismatches', 'closed_by', 'closed_at']
+    list_select_related = ['closed_by']
+    date_hierarchy = 'date'
+    
+    # Closed days are final, close them from the End of Day page
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,166 @@
+"""Best-fit table allocation.
+
+Each process keeps an index of the free tables at its location, sorted by
+seats and by number, so suggestions need no table scan. The index is
+rebuilt whenever the ``tables`` cache generation changes, which every
+table status change bumps. It may lag other processes by a moment, which is
+harmless: tables are claimed with a conditional UPDATE that only succeeds
+while they are still available, and a failed claim rebuilds the index and
+tries the next suggestion.
+
+A party too large for any free table can be seated at up to
+``COMBINE_MAX_TABLES`` adjacent (consecutively numbered) tables. The extra
+tables point at the first one through ``Table.joined_to`` and are freed
+with it.
+"""
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import generation, invalidate
+from .locations import get_current_location
+from .models import Table
+from .reservations import conflicting, default_length
+
+FreeTable = namedtuple('FreeTable', ['seats', 'number', 'id'])
+
+
+class AllocationError(Exception):
+    """Raised when no table can be found or claimed for a party"""
+
+
+@dataclass
+class Allocation:
+    tables: list
+
+    @property
+    def seats(self):
+        return sum(table.seats for table in self.tables)
+
+    @property
+    def table_ids(self):
+        return [table.id for table in self.tables]
+
+    def label(self):
+        return ' + '.join(f'Table {table.number}' for table in self.tables)
+
+    def as_dict(self):
+        return {
+            'tables': [table._asdict() for table in self.tables],
+            'seats': self.seats,
+            'label': self.label(),
+        }
+
+
+def combine_limit():
+    return settings.POS_SETTINGS.get('COMBINE_MAX_TABLES', 2)
+
+
+class FreeTableIndex:
+    """Free tables per location, rebuilt when the tables generation changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def snapshot(self, force=False):
+        """(by seats, by number) tuples of the current location's free tables"""
+        location = get_current_location()
+        current = generation('tables')
+        cached = self._snapshots.get(location)
+        if cached is not None and cached[0] == current and not force:
+            return cached[1]
+        with self._lock:
+            rows = Table.objects.filter(status='available').values_list('seats', 'number', 'id')
+            by_seats = sorted(FreeTable(*row) for row in rows)
+            by_number = sorted(by_seats, key=lambda table: table.number)
+            snapshot = (by_seats, by_number)
+            self._snapshots[location] = (current, snapshot)
+        return snapshot
+
+
+index = FreeTableIndex()
+
+
+def booked_soon(now=None):
+    """Ids of tables with a booking that a party seated now would run into"""
+    now = now or timezone.now()
+    return set(conflicting(now, now + default_length()).values_list('table_id', flat=True))
+
+
+def suggest(party_size, limit=3, force=False):
+    """Best-fit allocations for a party: fewest tables first, then fewest empty seats"""
+    by_seats, by_number = index.snapshot(force=force)
+    booked = booked_soon()
+    suggestions = []
+
+    start = bisect_left(by_seats, (party_size,))
+    for table in by_seats[start:]:
+        if table.id not in booked:
+            suggestions.append(Allocation([table]))
+            if len(suggestions) >= limit:
+                return suggestions
+
+    # No (or not enough) single tables: try runs of adjacent free tables
+    combos = []
+    for first, table in enumerate(by_number):
+        if table.seats >= party_size:
+            continue
+        run = [table]
+        for following in by_number[first + 1:first + combine_limit()]:
+            if following.number != run[-1].number + 1:
+                break
+            run.append(following)
+            if sum(t.seats for t in run) >= party_size:
+                if not booked.intersection(t.id for t in run):
+                    combos.append(Allocation(list(run)))
+                break
+    combos.sort(key=lambda allocation: (len(allocation.tables), allocation.seats))
+    return suggestions + combos[:limit - len(suggestions)]
+
+
+def claim(allocation):
+    """Mark an allocation's tables occupied, all or none, raising AllocationError if any was taken"""
+    primary, *extra = allocation.table_ids
+    with transaction.atomic(using=router.db_for_write(Table)):
+        claimed = Table.objects.filter(id=primary, status='available').update(status='occupied')
+        if extra:
+            claimed += Table.objects.filter(id__in=extra, status='available').update(
+                status='occupied', joined_to=primary,
+            )
+        if claimed != len(allocation.tables):
+            raise AllocationError(f'{allocation.label()} was just taken')
+        # After commit, so no process rebuilds its index from uncommitted state
+        transaction.on_commit(lambda: invalidate('tables'), using=router.db_for_write(Table))
+    return allocation
+
+
+def allocate(party_size, attempts=3):
+    """Find and claim the best-fit tables for a party"""
+    for attempt in range(attempts):
+        # After a lost race rebuild the index, another terminal got there first
+        for allocation in suggest(party_size, force=attempt > 0):
+            try:
+                return claim(allocation)
+            except AllocationError:
+                continue
+    raise AllocationError(f'No free table for a party of {party_size}')
+
+
+def claim_table(table):
+    """Claim one specific table, raising AllocationError if it is not available"""
+    return claim(Allocation([FreeTable(table.seats, table.number, table.id)]))
+
+
+def set_table_status(table_id, status):
+    """Set a table's status, carrying joined tables along; joins end once the party leaves"""
+    updates = {'status': status}
+    if status != 'occupied':
+        updates['joined_to'] = None
+    return Table.objects.filter(Q(id=table_id) | Q(joined_to_id=table_id)).update(**updates)
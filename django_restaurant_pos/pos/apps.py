@@ -4,4 +4,19 @@ from django.apps import AppConfig
 class PosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'pos'
-    verbose_name = 'Restaurant POS System'
\ No newline at end of file
+    verbose_name = 'Restaurant POS System'
+    
+    def ready(self):
+        from django.core.signals import request_finished
+        from django.db.models.signals import post_delete, post_save
+        from .cache import invalidate_on_save
+        from .events import flush_on_request_finished
+        from .locations import mirror_deleted_row, mirror_saved_row
+        
+        request_finished.connect(flush_on_request_finished, dispatch_uid='pos_flush_events')
+        post_save.connect(mirror_saved_row, dispatch_uid='pos_mirror_saved_row')
+        post_delete.connect(mirror_deleted_row, dispatch_uid='pos_mirror_deleted_row')
+        for model in ('Category', 'MenuItem', 'Table'):
+            sender = self.get_model(model)
+            post_save.connect(invalidate_on_save, sender=sender, dispatch_uid=f'pos_cache_save_{model}')
+            post_delete.connect(invalidate_on_save, sender=sender, dispatch_uid=f'pos_cache_delete_{model}')
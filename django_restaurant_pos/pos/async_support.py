@@ -0,0 +1,78 @@
+"""Async counterparts of the Django view helpers used by the POS views.
+
+Django 4.2's ``login_required``, ``csrf_exempt``, ``condition`` and
+``get_object_or_404`` wrap or call views synchronously, so they cannot be
+applied to ``async def`` views. These versions can. Anything that touches
+the session or runs a transaction goes through ``sync_to_async``; Django
+runs that work on one shared thread per process, while the event loop
+keeps serving other connections.
+"""
+import datetime
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+
+async def aget_object_or_404(model, **kwargs):
+    try:
+        return await model.objects.aget(**kwargs)
+    except model.DoesNotExist:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+
+
+def login_required(view_func):
+    @wraps(view_func)
+    async def wrapped(request, *args, **kwargs):
+        # request.user loads the session and the user from the database
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view_func(request, *args, **kwargs)
+    return wrapped
+
+
+def csrf_exempt(view_func):
+    @wraps(view_func)
+    async def wrapped(request, *args, **kwargs):
+        return await view_func(request, *args, **kwargs)
+    wrapped.csrf_exempt = True
+    return wrapped
+
+
+def condition(etag_func=None, last_modified_func=None, **cache_control):
+    """Answer unchanged resources with 304 like Django's ``condition``.
+
+    The ETag and Last-Modified callables are sync and run in one hop.
+    ``cache_control`` keywords are patched onto every response.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapped(request, *args, **kwargs):
+            def validators():
+                etag = etag_func(request, *args, **kwargs) if etag_func else None
+                last_modified = last_modified_func(request, *args, **kwargs) if last_modified_func else None
+                if last_modified:
+                    if not timezone.is_aware(last_modified):
+                        last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+                    last_modified = int(last_modified.timestamp())
+                return (quote_etag(etag) if etag is not None else None), last_modified
+
+            etag, last_modified = await sync_to_async(validators)()
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = await view_func(request, *args, **kwargs)
+
+            if request.method in ('GET', 'HEAD'):
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+                if etag:
+                    response.headers.setdefault('ETag', etag)
+            if cache_control:
+                patch_cache_control(response, **cache_control)
+            return response
+        return wrapped
+    return decorator
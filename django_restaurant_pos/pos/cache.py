@@ -0,0 +1,220 @@
+"""Two-tier cache for hot read views.
+
+Values are looked up in the per-process ``default`` (local memory) cache,
+then in the ``shared`` cache that all worker processes see. Shared entries
+carry a soft expiry: once it passes, one caller refreshes the value while
+everyone else keeps serving the stale copy, and a cold key is computed by a
+single caller per process and, via a lock entry in the shared tier, across
+processes. So twenty terminals refreshing the dashboard together trigger
+one rebuild.
+
+Entries belong to groups (``menu``, ``tables``...). ``invalidate(group)``
+bumps the group's generation, which is part of every key in the group, so
+all of its entries are dropped at once. Saves bump it only once their
+transaction commits, so a read in between cannot cache the old row under
+the new generation.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from django.db import transaction
+
+from .locations import get_current_location, shared_menu
+
+LOCAL_TTL = 2
+LOCK_TTL = 30
+WAIT_SECONDS = 5
+WAIT_STEP = 0.05
+LOCK_STRIPES = 64
+# Returned by get_or_compute(wait=False) while another caller computes the value
+PENDING = object()
+
+# A fixed pool: keys change with every generation, so a lock per key would
+# pile up. Keys that share a stripe only wait for each other. Reentrant, so
+# a compute that reads another cached value on its stripe cannot deadlock.
+_locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cache_metrics():
+    """Hit/miss counters for this process"""
+    with _stats_lock:
+        stats = dict(_stats)
+    hits = sum(stats.get(name, 0) for name in ('local_hits', 'shared_hits', 'stale_hits', 'coalesced'))
+    lookups = hits + stats.get('misses', 0)
+    stats['hit_ratio'] = round(hits / lookups, 3) if lookups else 0.0
+    return stats
+
+
+def local_cache():
+    return caches['default']
+
+
+def shared_cache():
+    try:
+        return caches['shared']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def default_ttl():
+    return settings.POS_SETTINGS.get('CACHE_TTL', 10)
+
+
+def _scope(group):
+    # Menu entries are global when the menu is shared, everything else is per location
+    if group == 'menu' and shared_menu():
+        return 'all'
+    return get_current_location()
+
+
+def _generation_key(group):
+    return f'pos:gen:{_scope(group)}:{group}'
+
+
+def generation(group):
+    """Current generation of a group, bumped by every invalidate"""
+    key = _generation_key(group)
+    generation = local_cache().get(key)
+    if generation is None:
+        generation = shared_cache().get(key, 0)
+        local_cache().set(key, generation, LOCAL_TTL)
+    return generation
+
+
+def invalidate(*groups):
+    """Drop every cached entry in the given groups, in all processes"""
+    for group in groups:
+        key = _generation_key(group)
+        try:
+            generation = shared_cache().incr(key)
+        except ValueError:
+            generation = 1
+            shared_cache().set(key, generation, None)
+        local_cache().set(key, generation, LOCAL_TTL)
+
+
+def make_key(name, groups=()):
+    parts = [f'{group}{generation(group)}' for group in groups]
+    scope = _scope(groups[0]) if groups else get_current_location()
+    return ':'.join(['pos', scope, name] + parts)
+
+
+def _process_lock(key):
+    return _locks[hash(key) % LOCK_STRIPES]
+
+
+def get_or_compute(name, compute, groups=(), ttl=None, wait=True):
+    """Return the cached value for ``name``, computing it at most once at a time.
+
+    With ``wait=False`` a cold value that another caller is computing gives
+    PENDING straight away instead of waiting for the result.
+    """
+    ttl = ttl or default_ttl()
+    key = make_key(name, groups)
+    local, shared = local_cache(), shared_cache()
+
+    value = local.get(key)
+    if value is not None:
+        _count('local_hits')
+        return value[1]
+
+    entry = shared.get(key)
+    if entry is not None:
+        fresh_until, data = entry
+        if fresh_until > time.time():
+            _count('shared_hits')
+            local.set(key, entry, min(LOCAL_TTL, ttl))
+            return data
+        # Stale: let one caller refresh, everyone else serves the old value
+        lock = _process_lock(key)
+        if not lock.acquire(blocking=False):
+            _count('stale_hits')
+            return data
+        try:
+            if not shared.add(f'{key}:lock', 1, LOCK_TTL):
+                _count('stale_hits')
+                return data
+            return _compute(key, compute, ttl)
+        finally:
+            lock.release()
+
+    lock = _process_lock(key)
+    if not lock.acquire(blocking=wait):
+        return PENDING
+    try:
+        # Another thread may have filled it while we waited for the lock
+        entry = local.get(key) or shared.get(key)
+        if entry is not None and entry[0] > time.time():
+            _count('coalesced')
+            return entry[1]
+        if shared.add(f'{key}:lock', 1, LOCK_TTL):
+            return _compute(key, compute, ttl)
+        if not wait:
+            return PENDING
+
+        # Another process is computing it, wait briefly for its result
+        deadline = time.time() + WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = shared.get(key)
+            if entry is not None:
+                _count('coalesced')
+                return entry[1]
+        return _compute(key, compute, ttl)
+    finally:
+        lock.release()
+
+
+async def aget_or_compute(name, compute, groups=(), ttl=None):
+    """get_or_compute for async views.
+
+    Waiting for another caller's result happens on the event loop, so the
+    thread that sync code shares stays free for other requests meanwhile.
+    """
+    lookup = sync_to_async(get_or_compute)
+    deadline = time.time() + WAIT_SECONDS
+    while time.time() < deadline:
+        value = await lookup(name, compute, groups, ttl, wait=False)
+        if value is not PENDING:
+            return value
+        await asyncio.sleep(WAIT_STEP)
+    # Whoever was computing it has stalled, compute it for this request
+    return await sync_to_async(compute)()
+
+
+def _compute(key, compute, ttl):
+    try:
+        _count('misses')
+        data = compute()
+        entry = (time.time() + ttl, data)
+        # Keep stale values around for as long again, to serve during refreshes
+        shared_cache().set(key, entry, ttl * 2)
+        local_cache().set(key, entry, min(LOCAL_TTL, ttl))
+        return data
+    finally:
+        shared_cache().delete(f'{key}:lock')
+
+
+def invalidate_on_save(sender, **kwargs):
+    """Signal handler dropping cached data when menu or table rows change, on commit"""
+    name = sender._meta.model_name
+    if name in ('category', 'menuitem'):
+        group = 'menu'
+    elif name == 'table':
+        group = 'tables'
+    else:
+        return
+    transaction.on_commit(lambda: invalidate(group), using=kwargs.get('using'))
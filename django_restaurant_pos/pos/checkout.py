@@ -0,0 +1,69 @@
+"""Checkout pipeline: take payment, close the order and free its table atomically"""
+from decimal import Decimal
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .allocation import set_table_status
+from .cache import invalidate
+from .events import record_event
+from .tasks import queue_rollup_update
+from .models import Order, Payment
+
+
+class CheckoutError(Exception):
+    """Raised when an order cannot be paid"""
+
+
+def checkout(order_id, method, amount, reference_number='', user=None):
+    """Pay for an order and release its table in one transaction.
+
+    The order is claimed with a conditional UPDATE that only matches an open
+    order whose total is covered, which locks the row on every backend
+    (including SQLite, where a read-then-write transaction cannot wait for
+    the write lock). The order is then read once for the columns checkout
+    needs, and the payment and table are written with narrow statements
+    instead of full-row saves. Returns the created Payment.
+    """
+    if method not in dict(Payment.PAYMENT_METHODS):
+        raise CheckoutError('Invalid payment method!')
+    amount = Decimal(amount)
+    if not amount.is_finite() or amount <= 0:
+        raise CheckoutError('Invalid payment amount!')
+
+    using = router.db_for_write(Order)
+    with transaction.atomic(using=using):
+        claimed = (
+            Order.objects.filter(id=order_id, total__lte=amount)
+            .exclude(status__in=Order.CLOSED_STATUSES)
+            .update(status='paid', updated_at=timezone.now())
+        )
+        order = Order.objects.only('id', 'order_number', 'status', 'total', 'table_id').filter(id=order_id).first()
+
+        if order is None:
+            raise CheckoutError('Order not found!')
+        if not claimed:
+            if order.status in Order.CLOSED_STATUSES:
+                raise CheckoutError(f'Order {order.order_number} is already {order.status}!')
+            raise CheckoutError('Payment amount is insufficient!')
+
+        payment = Payment.objects.create(
+            order=order,
+            amount=amount,
+            method=method,
+            reference_number=reference_number,
+            processed_by=user,
+        )
+
+        record_event('paid', order_id=order.id, table_id=order.table_id,
+                     amount=amount, total=order.total, method=method)
+        # Runs after the event joins the buffer, then writes it before queueing
+        transaction.on_commit(queue_rollup_update, using=using)
+        if order.table_id:
+            set_table_status(order.table_id, 'available')
+            record_event('table_status_changed', table_id=order.table_id, order_id=order.id, status='available')
+
+    if order.table_id:
+        invalidate('tables')
+
+    return payment
@@ -0,0 +1,168 @@
+"""End-of-day close and Z-reports.
+
+``build_report`` reads a day's orders with one query: each order joined to
+its payment (and who took it) and to its items (and their categories),
+sorted by order. Walking those rows once fills every breakdown: payment
+methods, staff, categories, cancellations, tax. It also flags orders
+whose payment does not square with their total.
+
+``close_day`` stores the result in a DayClose row that is never changed
+afterwards. Reports and reprints for a closed day read that row instead
+of scanning the orders again.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, router, transaction
+from django.utils import timezone
+
+from .models import DayClose, Order, Payment
+
+CHUNK_SIZE = 2000
+ZERO = Decimal('0.00')
+
+
+class CloseError(Exception):
+    """Raised when a day cannot be closed"""
+
+
+def _bucket():
+    return {'count': 0, 'amount': ZERO}
+
+
+def _check_payment(row):
+    """Why an order's payment does not match its total, or None"""
+    status, total, amount = row['status'], row['total'], row['payment__amount']
+    if amount is None:
+        return 'Paid without a payment record' if status == 'paid' else None
+    if status != 'paid':
+        return f'Payment recorded on a {status} order'
+    if amount < total:
+        return 'Payment is less than the order total'
+    # Cash may be overpaid and the difference given as change
+    if amount != total and row['payment__method'] != 'cash':
+        return 'Payment differs from the order total'
+    return None
+
+
+def build_report(date):
+    """Every Z-report figure for orders created on ``date``, in one pass"""
+    rows = (
+        Order.objects.filter(created_at__date=date)
+        .values(
+            'id', 'order_number', 'status', 'subtotal', 'tax_amount', 'total',
+            'payment__amount', 'payment__method', 'payment__processed_by__username',
+            'orderitem__quantity', 'orderitem__unit_price', 'orderitem__menu_item__category__name',
+        )
+        .order_by('id', 'orderitem__id')
+    )
+
+    statuses = defaultdict(int)
+    by_method = defaultdict(_bucket)
+    by_staff = defaultdict(_bucket)
+    by_category = defaultdict(lambda: {'quantity': 0, 'amount': ZERO})
+    voids = {'count': 0, 'amount': ZERO, 'items': 0}
+    totals = {'orders': 0, 'sales': ZERO, 'subtotal': ZERO, 'tax': ZERO, 'items_sold': 0,
+              'tendered': ZERO, 'change': ZERO}
+    mismatches = []
+
+    order_id = None
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        status = row['status']
+        # Order-level figures once, on the first row of each order
+        if row['id'] != order_id:
+            order_id = row['id']
+            totals['orders'] += 1
+            statuses[status] += 1
+            if status == 'paid':
+                totals['sales'] += row['total']
+                totals['subtotal'] += row['subtotal']
+                totals['tax'] += row['tax_amount']
+            elif status == 'cancelled':
+                voids['count'] += 1
+                voids['amount'] += row['total']
+            if row['payment__amount'] is not None:
+                for bucket in (by_method[row['payment__method']],
+                               by_staff[row['payment__processed_by__username'] or '']):
+                    bucket['count'] += 1
+                    bucket['amount'] += row['total']
+                totals['tendered'] += row['payment__amount']
+                if row['payment__method'] == 'cash':
+                    totals['change'] += max(row['payment__amount'] - row['total'], ZERO)
+            reason = _check_payment(row)
+            if reason:
+                mismatches.append({
+                    'order_number': row['order_number'],
+                    'status': status,
+                    'total': row['total'],
+                    'paid': row['payment__amount'],
+                    'reason': reason,
+                })
+
+        quantity = row['orderitem__quantity']
+        if quantity is None:
+            continue
+        if status == 'paid':
+            totals['items_sold'] += quantity
+            category = by_category[row['orderitem__menu_item__category__name'] or 'No category']
+            category['quantity'] += quantity
+            category['amount'] += quantity * row['orderitem__unit_price']
+        elif status == 'cancelled':
+            voids['items'] += quantity
+
+    methods = dict(Payment.PAYMENT_METHODS)
+    statuses_display = dict(Order.ORDER_STATUSES)
+    return dict(
+        totals,
+        date=date,
+        open_orders=sum(count for status, count in statuses.items() if status not in ('paid', 'cancelled')),
+        statuses=[
+            {'status': status, 'name': statuses_display.get(status, status), 'count': count}
+            for status, count in sorted(statuses.items())
+        ],
+        by_method=[
+            dict(bucket, method=method, name=methods.get(method, method))
+            for method, bucket in sorted(by_method.items())
+        ],
+        by_staff=[dict(bucket, username=username) for username, bucket in sorted(by_staff.items())],
+        by_category=[dict(bucket, name=name) for name, bucket in sorted(by_category.items())],
+        voids=voids,
+        mismatches=mismatches,
+    )
+
+
+def close_day(date, user=None):
+    """Build the day's report and freeze it as a DayClose; a day closes once.
+
+    Orders are counted on the day they were created, and a closed day is
+    never rebuilt, so a day with open orders cannot close: their payments
+    would fall into no report.
+    """
+    if date > timezone.localdate():
+        raise CloseError('A day cannot be closed before it starts')
+    if DayClose.objects.filter(date=date).exists():
+        raise CloseError(f'{date} is already closed')
+
+    report = build_report(date)
+    if report['open_orders']:
+        count = report['open_orders']
+        raise CloseError(f'{count} order{"s" if count != 1 else ""} still open, pay or cancel them first')
+    try:
+        with transaction.atomic(using=router.db_for_write(DayClose)):
+            return DayClose.objects.create(
+                date=date,
+                orders=report['orders'],
+                sales=report['sales'],
+                tax=report['tax'],
+                mismatches=len(report['mismatches']),
+                report=report,
+                closed_by=user,
+            )
+    except IntegrityError:
+        raise CloseError(f'{date} is already closed')
+
+
+def day_report(date):
+    """(DayClose or None, report): the frozen report of a closed day, else a live one"""
+    closed = DayClose.objects.select_related('closed_by').filter(date=date).first()
+    return closed, (closed.report if closed else build_report(date))
@@ -0,0 +1,155 @@
+"""Append-only order event log.
+
+Views record events through a per-process buffer instead of writing a row
+per change. Events join the buffer only once the surrounding transaction
+commits, and the buffer is written with one bulk insert per database when
+it reaches ``EVENT_BATCH_SIZE``, at the end of every request, and at exit.
+A process that dies between flushes loses its unflushed events, which is
+the price of keeping the write off the request path.
+"""
+import atexit
+import threading
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils import timezone
+
+from .models import DailySalesRollup, OrderEvent
+
+
+class EventBuffer:
+    """Thread-safe in-memory buffer of events waiting to be inserted"""
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def _get_batch_size(self):
+        return self.batch_size or settings.POS_SETTINGS.get('EVENT_BATCH_SIZE', 100)
+
+    def record(self, event_type, order_id=None, table_id=None, **data):
+        """Queue an event, to be buffered once the current transaction commits"""
+        using = router.db_for_write(OrderEvent)
+        event = OrderEvent(
+            event_type=event_type,
+            order_id=order_id,
+            table_id=table_id,
+            data=data,
+            created_at=timezone.now(),
+        )
+        transaction.on_commit(lambda: self._append(using, event), using=using)
+
+    def _append(self, using, event):
+        with self._lock:
+            self._pending.append((using, event))
+            full = len(self._pending) >= self._get_batch_size()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Insert all buffered events, one bulk insert per database"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+
+        by_database = defaultdict(list)
+        for using, event in pending:
+            by_database[using].append(event)
+        for using, events in by_database.items():
+            OrderEvent.objects.using(using).bulk_create(events)
+        return len(pending)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+buffer = EventBuffer()
+record_event = buffer.record
+flush_events = buffer.flush
+
+
+def flush_on_request_finished(sender, **kwargs):
+    flush_events()
+
+
+atexit.register(flush_events)
+
+
+def replay(since_id=0, event_types=None, chunk_size=2000):
+    """Iterate over logged events in append order"""
+    events = OrderEvent.objects.filter(id__gt=since_id).order_by('id')
+    if event_types:
+        events = events.filter(event_type__in=event_types)
+    return events.iterator(chunk_size=chunk_size)
+
+
+def stream(after_id=0, limit=500):
+    """Next batch of events after ``after_id``, for change-feed consumers"""
+    return list(OrderEvent.objects.filter(id__gt=after_id).order_by('id')[:limit])
+
+
+def _moved_to(event, status):
+    """Whether a status_changed event moved an order into ``status``"""
+    data = event.data
+    return event.event_type == 'status_changed' and data.get('to') == status and data.get('from') != status
+
+
+def apply_events(rollups, events):
+    """Fold events into a dict of date -> DailySalesRollup"""
+    for event in events:
+        date = timezone.localdate(event.created_at)
+        rollup = rollups.get(date)
+        if rollup is None:
+            rollup = rollups[date] = DailySalesRollup(date=date, item_quantities={})
+
+        data = event.data
+        if event.event_type == 'order_created':
+            rollup.orders_created += 1
+        elif event.event_type == 'item_added':
+            quantity = data.get('quantity', 0)
+            name = data.get('name', str(data.get('menu_item_id')))
+            rollup.items_sold += quantity
+            rollup.item_quantities[name] = rollup.item_quantities.get(name, 0) + quantity
+        elif event.event_type == 'paid' or _moved_to(event, 'paid'):
+            # Checkout records 'paid'; a manual status change counts the same
+            rollup.orders_paid += 1
+            rollup.revenue += Decimal(str(data.get('total', 0)))
+        elif _moved_to(event, 'cancelled'):
+            rollup.orders_cancelled += 1
+        rollup.last_event_id = max(rollup.last_event_id, event.id)
+    return rollups
+
+
+def update_rollups(rebuild=False):
+    """Bring daily rollups up to date by replaying the event log.
+
+    Without ``rebuild`` only events newer than the last one already rolled up
+    are replayed and merged into the existing rows. Returns the rollups that
+    were written.
+    """
+    using = router.db_for_write(DailySalesRollup)
+    with transaction.atomic(using=using):
+        if rebuild:
+            DailySalesRollup.objects.all().delete()
+            since_id = 0
+        else:
+            since_id = max(DailySalesRollup.objects.values_list('last_event_id', flat=True), default=0)
+
+        # Load existing rows lazily, only for dates the new events touch
+        rollups = {}
+        existing = {}
+        for event in replay(since_id):
+            date = timezone.localdate(event.created_at)
+            if date not in rollups and date not in existing:
+                existing[date] = DailySalesRollup.objects.filter(date=date).first()
+                if existing[date]:
+                    rollups[date] = existing[date]
+            apply_events(rollups, [event])
+
+        for rollup in rollups.values():
+            rollup.save()
+    return list(rollups.values())
@@ -1,5 +1,9 @@
+from datetime import datetime, timedelta
+
 from django import forms
 from django.contrib.auth.forms import AuthenticationForm
+from django.db.models import Q
+from django.utils import timezone
 from .models import MenuItem, Category, Order, Table
 
 
@@ -67,6 +71,22 @@ class CategoryForm(forms.ModelForm):
 
 
 class OrderForm(forms.ModelForm):
+    party_size = forms.IntegerField(
+        min_value=1,
+        required=False,
+        widget=forms.NumberInput(attrs={
+            'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500',
+            'placeholder': 'Guests (picks the best table if none is chosen)'
+        })
+    )
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Editing keeps the order's own table selectable even though it is occupied
+        self.fields['table'].queryset = Table.objects.filter(
+            Q(status='available') | Q(id=self.instance.table_id)
+        ).order_by('number')
+    
     class Meta:
         model = Order
         fields = ['table', 'customer_name', 'notes']
@@ -83,4 +103,59 @@ class OrderForm(forms.ModelForm):
                 'placeholder': 'Special instructions',
                 'rows': 3
             })
-        }
\ No newline at end of file
+        }
+
+
+class MenuImportForm(forms.Form):
+    file = forms.FileField(
+        help_text='CSV or JSON file in the menu export format',
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500',
+            'accept': '.csv,.json'
+        })
+    )
+    dry_run = forms.BooleanField(
+        required=False,
+        initial=True,
+        label='Preview changes only',
+        widget=forms.CheckboxInput(attrs={
+            'class': 'w-4 h-4 text-blue-600 bg-gray-100 border-gray-300 rounded focus:ring-blue-500'
+        })
+    )
+
+
+INPUT_CLASS = 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500'
+
+
+class ReservationSearchForm(forms.Form):
+    party_size = forms.IntegerField(min_value=1, initial=2, widget=forms.NumberInput(attrs={'class': INPUT_CLASS}))
+    date = forms.DateField(widget=forms.DateInput(attrs={'class': INPUT_CLASS, 'type': 'date'}))
+    time = forms.TimeField(widget=forms.TimeInput(attrs={'class': INPUT_CLASS, 'type': 'time'}))
+    minutes = forms.IntegerField(
+        min_value=15,
+        initial=90,
+        label='Length (minutes)',
+        widget=forms.NumberInput(attrs={'class': INPUT_CLASS, 'step': 15})
+    )
+    
+    def slot(self):
+        """Aware start and end datetimes of the requested slot"""
+        start = timezone.make_aware(datetime.combine(self.cleaned_data['date'], self.cleaned_data['time']))
+        return start, start + timedelta(minutes=self.cleaned_data['minutes'])
+
+
+class ReservationForm(ReservationSearchForm):
+    table = forms.ModelChoiceField(queryset=Table.objects.all(), widget=forms.HiddenInput)
+    customer_name = forms.CharField(
+        max_length=100,
+        widget=forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Guest name'})
+    )
+    phone = forms.CharField(
+        max_length=30,
+        required=False,
+        widget=forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Phone (optional)'})
+    )
+    notes = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'class': INPUT_CLASS, 'placeholder': 'Notes (optional)'})
+    )
@@ -0,0 +1,141 @@
+"""Portion inventory for menu items.
+
+Each tracked item's stock is split over ``STOCK_SHARDS`` StockShard rows.
+A reservation decrements a randomly chosen shard with a conditional UPDATE
+(``quantity >= n``), so parallel orders rarely touch the same row and can
+never take a shard below zero. Only when no single shard can cover the
+request are several shards drained, inside a savepoint that is rolled back
+if the total still falls short.
+
+Stock is counted per location, so an item whose stock reaches zero is sold
+out only at that location. Menu reads leave out ``sold_out_ids()``, derived
+from the location's shards; the shared ``is_available`` flag stays the
+manager's own switch.
+"""
+import random
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Sum
+
+from .cache import get_or_compute, invalidate
+from .models import MenuItem, OrderItem, StockShard
+
+
+class OutOfStock(Exception):
+    """Raised when a reservation asks for more portions than are left"""
+
+
+def shard_count():
+    return settings.POS_SETTINGS.get('STOCK_SHARDS', 4)
+
+
+def stock_levels(menu_item_ids=None):
+    """Mapping of menu item id to portions left, for tracked items only"""
+    shards = StockShard.objects.all()
+    if menu_item_ids is not None:
+        shards = shards.filter(menu_item_id__in=menu_item_ids)
+    return dict(shards.values_list('menu_item_id').annotate(total=Sum('quantity')).order_by())
+
+
+def sold_out_ids():
+    """Ids of tracked items with no portions left at the current location"""
+    return get_or_compute('sold_out', lambda: set(
+        StockShard.objects.values('menu_item_id').annotate(total=Sum('quantity')).filter(total__lte=0)
+        .values_list('menu_item_id', flat=True)
+    ), groups=('stock',))
+
+
+def is_sold_out(menu_item_id):
+    shards = StockShard.objects.filter(menu_item_id=menu_item_id)
+    return shards.exists() and not shards.filter(quantity__gt=0).exists()
+
+
+def _stock_changed():
+    # Only once the portions are committed, or a read could cache the old state
+    transaction.on_commit(lambda: invalidate('stock'), using=router.db_for_write(StockShard))
+
+
+def set_stock(menu_item_id, quantity):
+    """Set an item's stock, or stop tracking it when quantity is None"""
+    using = router.db_for_write(StockShard)
+    with transaction.atomic(using=using):
+        StockShard.objects.filter(menu_item_id=menu_item_id).delete()
+        if quantity is not None:
+            shards = shard_count()
+            StockShard.objects.bulk_create([
+                StockShard(
+                    menu_item_id=menu_item_id,
+                    shard=shard,
+                    quantity=quantity // shards + (1 if shard < quantity % shards else 0),
+                )
+                for shard in range(shards)
+            ])
+        _stock_changed()
+
+
+def reserve(menu_item_id, quantity):
+    """Take ``quantity`` portions of an item, raising OutOfStock if short.
+
+    Untracked items always succeed. Call inside the transaction that records
+    the order item, so a failed order gives the stock back.
+    """
+    shard_ids = list(StockShard.objects.filter(menu_item_id=menu_item_id).values_list('id', flat=True))
+    if not shard_ids:
+        return
+
+    random.shuffle(shard_ids)
+    # Fast path: one shard covers the whole request
+    for shard_id in shard_ids:
+        if StockShard.objects.filter(id=shard_id, quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+            break
+    else:
+        _reserve_across_shards(menu_item_id, shard_ids, quantity)
+
+    if not StockShard.objects.filter(menu_item_id=menu_item_id, quantity__gt=0).exists():
+        _stock_changed()
+
+
+def _reserve_across_shards(menu_item_id, shard_ids, quantity, passes=3):
+    remaining = quantity
+    with transaction.atomic(using=router.db_for_write(StockShard)):
+        for _ in range(passes):
+            for shard_id, available in StockShard.objects.filter(id__in=shard_ids).values_list('id', 'quantity'):
+                take = min(available, remaining)
+                # Only succeeds if nobody changed the shard since we read it
+                if take and StockShard.objects.filter(id=shard_id, quantity=available).update(
+                    quantity=F('quantity') - take,
+                ):
+                    remaining -= take
+                    if not remaining:
+                        return
+            if (stock_levels([menu_item_id]).get(menu_item_id) or 0) < remaining:
+                break
+        name = MenuItem.objects.filter(id=menu_item_id).values_list('name', flat=True).first()
+        raise OutOfStock(f'{name} is out of stock!')
+
+
+def release(menu_item_id, quantity):
+    """Give portions back, e.g. when an order is cancelled"""
+    shard_ids = list(StockShard.objects.filter(menu_item_id=menu_item_id).values_list('id', flat=True))
+    if not shard_ids or quantity <= 0:
+        return
+    StockShard.objects.filter(id=random.choice(shard_ids)).update(quantity=F('quantity') + quantity)
+    if menu_item_id in sold_out_ids():
+        _stock_changed()
+
+
+def order_quantities(order_id):
+    return OrderItem.objects.filter(order_id=order_id).values_list('menu_item_id', 'quantity')
+
+
+def reserve_order(order_id):
+    """Reserve stock for every item of an order (e.g. when un-cancelling it)"""
+    for menu_item_id, quantity in order_quantities(order_id):
+        reserve(menu_item_id, quantity)
+
+
+def release_order(order_id):
+    """Return stock for every item of a cancelled order"""
+    for menu_item_id, quantity in order_quantities(order_id):
+        release(menu_item_id, quantity)
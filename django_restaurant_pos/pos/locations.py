@@ -0,0 +1,165 @@
+"""Restaurant locations and the database each one uses.
+
+Every location listed in ``settings.POS_LOCATIONS`` keeps its orders, order
+items, payments and tables in its own database alias. Users, and the menu
+when ``POS_SETTINGS['SHARED_MENU']`` is on, live in the shared ``default``
+database and are mirrored into each location database so foreign keys from
+orders keep working there.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+
+SHARED_DB = DEFAULT_DB_ALIAS
+LOCATION_COOKIE = 'pos_location'
+LOCATION_HEADER = 'HTTP_X_POS_LOCATION'
+
+_current_location = contextvars.ContextVar('pos_location', default=None)
+
+
+def get_locations():
+    """Mapping of location code to its settings dict"""
+    return getattr(settings, 'POS_LOCATIONS', {'main': {'NAME': 'Main', 'DATABASE': SHARED_DB}})
+
+
+def default_location():
+    return settings.POS_SETTINGS.get('DEFAULT_LOCATION') or next(iter(get_locations()))
+
+
+def shared_menu():
+    return settings.POS_SETTINGS.get('SHARED_MENU', True)
+
+
+def get_current_location():
+    return _current_location.get() or default_location()
+
+
+def location_db(code=None):
+    """Database alias for a location, defaulting to the current one"""
+    return get_locations()[code or get_current_location()]['DATABASE']
+
+
+def location_databases():
+    """Distinct database aliases used by locations"""
+    return sorted({location['DATABASE'] for location in get_locations().values()})
+
+
+@contextmanager
+def use_location(code):
+    """Route location-scoped queries in this block to the given location"""
+    if code not in get_locations():
+        raise ValueError(f'Unknown location "{code}"')
+    token = _current_location.set(code)
+    try:
+        yield
+    finally:
+        _current_location.reset(token)
+
+
+def resolve_location(request):
+    """Location for a request: X-POS-Location header, then the device cookie"""
+    for code in (request.META.get(LOCATION_HEADER), request.COOKIES.get(LOCATION_COOKIE)):
+        if code in get_locations():
+            return code
+    return default_location()
+
+
+class LocationMiddleware:
+    """Select the location database for the duration of each request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.location = resolve_location(request)
+        with use_location(request.location):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        # The context variable is copied into sync_to_async threads
+        request.location = resolve_location(request)
+        with use_location(request.location):
+            return await self.get_response(request)
+
+
+def location_context(request):
+    """Template context processor exposing the current location"""
+    locations = get_locations()
+    code = getattr(request, 'location', None) or get_current_location()
+    return {
+        'current_location': code,
+        'current_location_name': locations[code].get('NAME', code),
+        'locations': locations if len(locations) > 1 else {},
+    }
+
+
+# Mirroring of shared rows into location databases
+
+def shared_models():
+    from .models import Category, MenuItem
+    return [User, Category, MenuItem] if shared_menu() else [User]
+
+
+def mirror_databases():
+    return [alias for alias in location_databases() if alias != SHARED_DB]
+
+
+def _copy_row(instance, alias):
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+        if not field.primary_key
+    }
+    manager = model._base_manager.using(alias)
+    if not manager.filter(pk=instance.pk).update(**values):
+        manager.bulk_create([model(pk=instance.pk, **values)])
+
+
+def mirror_saved_row(sender, instance, using, raw=False, **kwargs):
+    if raw or using != SHARED_DB or sender not in shared_models():
+        return
+    for alias in mirror_databases():
+        _copy_row(instance, alias)
+
+
+def mirror_deleted_row(sender, instance, using, **kwargs):
+    if using != SHARED_DB or sender not in shared_models():
+        return
+    for alias in mirror_databases():
+        sender._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def sync_shared_rows():
+    """Copy every shared row into every location database.
+
+    Needed after bulk writes, which skip the save signals, and when a new
+    location database is added. Returns the number of rows copied.
+    """
+    copied = 0
+    aliases = mirror_databases()
+    if not aliases:
+        return copied
+    for model in shared_models():
+        rows = list(model._base_manager.using(SHARED_DB).all())
+        for alias in aliases:
+            manager = model._base_manager.using(alias)
+            existing = set(manager.values_list('pk', flat=True))
+            for row in rows:
+                if row.pk in existing:
+                    _copy_row(row, alias)
+            manager.bulk_create([row for row in rows if row.pk not in existing])
+            manager.exclude(pk__in=[row.pk for row in rows]).delete()
+            copied += len(rows)
+    return copied
+
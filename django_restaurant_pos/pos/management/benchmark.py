@@ -0,0 +1,236 @@
+"""Helpers shared by the benchmark and stress-test management commands and the tests"""
+import json
+import os
+import shutil
+import statistics
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.db import connections
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from pos.events import flush_events
+from pos.inventory import set_stock
+from pos.models import (
+    Category, DailySalesRollup, MenuItem, Order, OrderEvent, OrderItem, Payment, Reservation, Table, Task,
+)
+
+# Most pages need a handful of queries; these legitimately need a few more
+DEFAULT_BUDGET = 12
+BUDGETS = {
+    'pos:dashboard': 15,
+    'pos:metrics': 15,
+    'pos:location_report': 15,
+}
+# Views that change data on GET, or end the session
+BUDGET_SKIP = {'pos:logout', 'pos:toggle_menu_item'}
+# Write endpoints on the ordering and payment paths, with the payloads
+# from budget_posts(); the sync batch holds three operations
+WRITE_BUDGETS = {
+    'pos:api_add_to_order': 20,
+    'pos:api_sync': 70,
+    'pos:update_order_status': 10,
+    'pos:book_reservation': 10,
+    'pos:process_payment': 20,
+}
+
+
+@contextmanager
+def scratch_database(alias='default'):
+    """Run the block against a throwaway test database.
+
+    SQLite test databases default to in-memory, which threads cannot share
+    for writes, so a temporary file is used instead. The connection points
+    back at the real database afterwards, and buffered events are written
+    before the scratch one goes away.
+    """
+    connection = connections[alias]
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST'].get('NAME')
+    tmpdir = tempfile.mkdtemp(prefix='pos-bench-')
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            flush_events()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        connection.settings_dict['NAME'] = old_name
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def seed_menu(categories=4, items_per_category=10):
+    """Create categories and menu items, returning the items"""
+    created = Category.objects.bulk_create([
+        Category(name=f'Category {c}') for c in range(categories)
+    ])
+    MenuItem.objects.bulk_create([
+        MenuItem(
+            name=f'Item {c}-{i}',
+            description='Benchmark item',
+            price=Decimal('5.00') + i,
+            category=category,
+        )
+        for c, category in enumerate(created)
+        for i in range(items_per_category)
+    ])
+    return list(MenuItem.objects.all())
+
+
+def seed_tables(count=20, seats=4, start=1):
+    Table.objects.bulk_create([Table(number=n, seats=seats) for n in range(start, start + count)])
+    return list(Table.objects.filter(number__gte=start, number__lt=start + count).order_by('number'))
+
+
+def seed_user(username='bench', **extra):
+    user, _ = User.objects.get_or_create(username=username, defaults=extra)
+    return user
+
+
+def seed_orders(count, menu_items, tables=None, items_per_order=3, status='pending', user=None, prefix='BENCH'):
+    """Create orders with items and computed totals using bulk inserts"""
+    tables = tables or []
+    orders = []
+    for n in range(count):
+        table = tables[n % len(tables)] if tables else None
+        orders.append(Order(
+            order_number=f'{prefix}{n:08d}',
+            table=table,
+            status=status,
+            created_by=user,
+        ))
+    Order.objects.bulk_create(orders)
+    orders = list(Order.objects.filter(order_number__startswith=prefix).order_by('id'))
+
+    order_items = []
+    for n, order in enumerate(orders):
+        subtotal = Decimal('0')
+        for i in range(items_per_order):
+            menu_item = menu_items[(n + i) % len(menu_items)]
+            order_items.append(OrderItem(order=order, menu_item=menu_item, quantity=1, unit_price=menu_item.price))
+            subtotal += menu_item.price
+        order.subtotal = subtotal
+        order.tax_amount = (subtotal * Decimal('0.08')).quantize(Decimal('0.01'))
+        order.total = order.subtotal + order.tax_amount
+    OrderItem.objects.bulk_create(order_items)
+    Order.objects.bulk_update(orders, ['subtotal', 'tax_amount', 'total'])
+    return orders
+
+
+def summarize_latencies(latencies):
+    """p50/p95/max in milliseconds for a list of durations in seconds"""
+    if not latencies:
+        return {'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        'p50': statistics.median(ordered) * 1000,
+        'p95': p95 * 1000,
+        'max': ordered[-1] * 1000,
+    }
+
+
+def seed_budget_data(scale, batch=0):
+    """Orders, payments, bookings, events and tasks in proportion to ``scale``.
+
+    Each ``batch`` adds rows that do not collide with earlier batches, so a
+    second call grows the data. Returns (user, orders, menu items, tables).
+    """
+    user = seed_user('budget', is_staff=True, is_superuser=True)
+    menu_items = seed_menu(categories=4, items_per_category=scale // 10 + 2)
+    tables = seed_tables(scale // 5 + 5, start=batch * 1000 + 1)
+    orders = seed_orders(scale, menu_items, tables, items_per_order=4, user=user, prefix=f'BUDGET{batch}-')
+    set_stock(menu_items[0].id, 100)
+
+    paid = orders[::2]
+    Payment.objects.bulk_create([
+        Payment(order=order, amount=order.total, method='card', processed_by=user) for order in paid
+    ])
+    for order in paid:
+        order.status = 'paid'
+    Order.objects.bulk_update(paid, ['status'])
+
+    start = timezone.now().replace(minute=0, second=0, microsecond=0)
+    Reservation.objects.bulk_create([
+        Reservation(
+            table=tables[n % len(tables)], customer_name=f'Guest {n}', party_size=2,
+            start=start + timedelta(hours=n % 8), end=start + timedelta(hours=n % 8, minutes=90),
+        )
+        for n in range(scale)
+    ])
+    OrderEvent.objects.bulk_create([
+        OrderEvent(event_type='order_created', order_id=order.id, data={'order_number': order.order_number})
+        for order in orders
+    ])
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(date=(start - timedelta(days=batch * 30 + n)).date()) for n in range(min(scale, 30))
+    ])
+    Task.objects.bulk_create([Task(name='pos.update_rollups', status='done') for _ in range(scale)])
+    return user, orders, menu_items, tables
+
+
+def budget_objects(orders, menu_items, tables):
+    """Ids of seeded rows to fill the URL arguments and payloads of the budget requests"""
+    open_orders = [order for order in orders if order.status != 'paid']
+    return {
+        'order_id': orders[-1].id,
+        'item_id': menu_items[0].id,
+        'table_id': tables[0].id,
+        'reservation_id': Reservation.objects.values_list('id', flat=True).first(),
+        'open_order_id': open_orders[-1].id,
+        'payable_order_id': open_orders[-2].id,
+        'payable_amount': str(open_orders[-2].total),
+    }
+
+
+def budget_urls(objects):
+    """(url name, path) of every POS page and admin changelist under a query budget"""
+    from pos import urls as pos_urls
+
+    urls = []
+    for pattern in pos_urls.urlpatterns:
+        if not isinstance(pattern, URLPattern):
+            continue
+        name = f'{pos_urls.app_name}:{pattern.name}'
+        if name in BUDGET_SKIP:
+            continue
+        kwargs = {arg: objects[arg] for arg in pattern.pattern.regex.groupindex}
+        urls.append((name, reverse(name, kwargs=kwargs)))
+    for model in admin.site._registry:
+        name = f'admin:{model._meta.app_label}_{model._meta.model_name}_changelist'
+        urls.append((name, reverse(name)))
+    return urls
+
+
+def budget_posts(objects):
+    """(url name, path, data, content type) of each write endpoint under a budget.
+
+    Run in order, once per database: the payment closes its order.
+    """
+    order_id, item_id = objects['open_order_id'], objects['item_id']
+    day = timezone.localdate() + timedelta(days=30)
+    return [
+        ('pos:api_add_to_order', reverse('pos:api_add_to_order'),
+         json.dumps({'order_id': order_id, 'menu_item_id': item_id, 'quantity': 1}), 'application/json'),
+        ('pos:api_sync', reverse('pos:api_sync'), json.dumps({'operations': [
+            {'key': f'budget-{order_id}-{n}', 'op': 'add_item', 'order_id': order_id, 'menu_item_id': item_id}
+            for n in range(3)
+        ]}), 'application/json'),
+        ('pos:update_order_status', reverse('pos:update_order_status', kwargs={'order_id': order_id}),
+         {'status': 'preparing'}, None),
+        ('pos:book_reservation', reverse('pos:book_reservation'), {
+            'table': objects['table_id'], 'party_size': 2, 'date': day.isoformat(), 'time': '12:00',
+            'minutes': 90, 'customer_name': 'Budget guest',
+        }, None),
+        ('pos:process_payment', reverse('pos:process_payment', kwargs={'order_id': objects['payable_order_id']}),
+         {'payment_method': 'card', 'amount': objects['payable_amount']}, None),
+    ]
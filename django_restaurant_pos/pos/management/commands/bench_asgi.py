@@ -0,0 +1,151 @@
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from pos.events import flush_events
+from pos.management.benchmark import (
+    scratch_database, seed_menu, seed_orders, seed_tables, seed_user, summarize_latencies,
+)
+
+
+class InFlight:
+    """Counts connections being served at once and remembers the peak"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.current -= 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the terminal API served through the WSGI handler (a fixed pool of worker threads) '
+        'with the ASGI handler (one event loop) as the number of concurrent terminals grows'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', default='1,8,32,128', help='Comma separated numbers of concurrent terminals')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads, as in gunicorn --threads')
+        parser.add_argument('--requests', type=int, default=20, help='Requests per terminal')
+        parser.add_argument(
+            '--client-delay', type=float, default=50,
+            help='Milliseconds each request holds its connection before the view runs, like a slow Wi-Fi client',
+        )
+
+    def requests_for(self, n, order_id, menu_item_id):
+        """The n-th request of a terminal: (method, path, data, content type)"""
+        kind = n % 4
+        if kind == 0:
+            return 'get', reverse('pos:api_menu_items'), None, None
+        if kind == 1:
+            body = json.dumps({'order_id': order_id, 'menu_item_id': menu_item_id})
+            return 'post', reverse('pos:api_add_to_order'), body, 'application/json'
+        if kind == 2:
+            return 'get', reverse('pos:api_order_totals', args=[order_id]), None, None
+        status = 'preparing' if n % 8 == 3 else 'pending'
+        return 'post', reverse('pos:update_order_status', args=[order_id]), {'status': status}, None
+
+    def run_wsgi(self, user, orders, menu_item_id, clients, options):
+        delay = options['client_delay'] / 1000
+        in_flight, latencies, errors = InFlight(), [], []
+        local = threading.local()
+
+        def serve(method, path, data, content_type):
+            # A sync worker thread is busy for the whole request, slow client included
+            with in_flight:
+                time.sleep(delay)
+                if not hasattr(local, 'client'):
+                    local.client = Client()
+                    local.client.force_login(user)
+                kwargs = {'content_type': content_type} if content_type else {}
+                return getattr(local.client, method)(path, data, **kwargs)
+
+        def terminal(pool, order_id):
+            for n in range(options['requests']):
+                started = time.perf_counter()
+                response = pool.submit(serve, *self.requests_for(n, order_id, menu_item_id)).result()
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200 or response.json().get('success') is False:
+                    errors.append(response)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['threads']) as pool:
+            terminals = [
+                threading.Thread(target=terminal, args=(pool, orders[i].id)) for i in range(clients)
+            ]
+            for thread in terminals:
+                thread.start()
+            for thread in terminals:
+                thread.join()
+        return time.perf_counter() - started, latencies, len(errors), in_flight.peak
+
+    def run_asgi(self, user, orders, menu_item_id, clients, options):
+        delay = options['client_delay'] / 1000
+        in_flight, latencies, errors = InFlight(), [], []
+        client = AsyncClient()
+        client.force_login(user)
+
+        async def terminal(order_id):
+            for n in range(options['requests']):
+                method, path, data, content_type = self.requests_for(n, order_id, menu_item_id)
+                kwargs = {'content_type': content_type} if content_type else {}
+                started = time.perf_counter()
+                # A waiting connection only costs the event loop a suspended task
+                with in_flight:
+                    await asyncio.sleep(delay)
+                    response = await getattr(client, method)(path, data, **kwargs)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200 or response.json().get('success') is False:
+                    errors.append(response)
+
+        async def main():
+            await asyncio.gather(*(terminal(orders[i].id) for i in range(clients)))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return time.perf_counter() - started, latencies, len(errors), in_flight.peak
+
+    def handle(self, *args, **options):
+        counts = [int(count) for count in options['clients'].split(',')]
+        with tempfile.TemporaryDirectory(prefix='pos-bench-') as tmpdir, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            POS_SETTINGS=dict(settings.POS_SETTINGS, METRICS_DIR=tmpdir),
+        ), scratch_database():
+            user = seed_user('bench-asgi', is_staff=True)
+            menu_items = seed_menu(categories=4, items_per_category=10)
+            # One open order per terminal so status changes never collide
+            orders = seed_orders(max(counts), menu_items, seed_tables(20), user=user)
+
+            self.stdout.write(
+                f'{options["threads"]} WSGI threads, {options["requests"]} requests per terminal, '
+                f'{options["client_delay"]:.0f} ms client delay'
+            )
+            self.stdout.write(f'{"terminals":>9} {"path":>5} {"req/s":>8} {"p50 ms":>8} {"p95 ms":>8} '
+                              f'{"max ms":>8} {"held":>5} {"errors":>6}')
+            for clients in counts:
+                for path, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                    elapsed, latencies, errors, peak = run(user, orders, menu_items[0].id, clients, options)
+                    stats = summarize_latencies(latencies)
+                    self.stdout.write(
+                        f'{clients:>9} {path:>5} {len(latencies) / elapsed:>8.1f} {stats["p50"]:>8.1f} '
+                        f'{stats["p95"]:>8.1f} {stats["max"]:>8.1f} {peak:>5} {errors:>6}'
+                    )
+            flush_events()
+        self.stdout.write('"held" is the most connections served at once: capped by the thread count for WSGI')
@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from pos.checkout import CheckoutError, checkout
+from pos.management.benchmark import (
+    scratch_database, seed_menu, seed_orders, seed_tables, seed_user, summarize_latencies,
+)
+from pos.models import Order, Payment, Table
+
+
+class Command(BaseCommand):
+    help = 'Measure checkout throughput under concurrent payments on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--duplicates', type=int, default=2,
+                            help='Concurrent attempts per order, to exercise double-payment protection')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = seed_user()
+            tables = seed_tables(options['orders'])
+            orders = seed_orders(options['orders'], seed_menu(), tables, user=user)
+            Table.objects.update(status='occupied')
+            attempts = [(order.id, order.total) for order in orders] * options['duplicates']
+
+            latencies, failures = [], []
+
+            def pay(attempt):
+                order_id, total = attempt
+                started = time.perf_counter()
+                try:
+                    checkout(order_id, 'card', total, user=user)
+                    latencies.append(time.perf_counter() - started)
+                except CheckoutError:
+                    pass
+                except Exception as e:
+                    failures.append(e)
+                finally:
+                    connections.close_all()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                list(pool.map(pay, attempts))
+            elapsed = time.perf_counter() - started
+
+            paid = Order.objects.filter(status='paid').count()
+            payments = Payment.objects.count()
+            held = Table.objects.filter(status='occupied', order__status='paid').count()
+            stats = summarize_latencies(latencies)
+
+            self.stdout.write(f'backend: {connection.vendor}, workers: {options["workers"]}')
+            self.stdout.write(f'attempts: {len(attempts)}, checkouts: {len(latencies)}, errors: {len(failures)}')
+            self.stdout.write(f'throughput: {len(latencies) / elapsed:.1f} checkouts/s')
+            self.stdout.write('latency ms: p50 {p50:.2f}, p95 {p95:.2f}, max {max:.2f}'.format(**stats))
+            self.stdout.write(f'paid orders: {paid}, payments: {payments}, tables held by paid orders: {held}')
+            for error in failures[:5]:
+                self.stdout.write(self.style.ERROR(f'{type(error).__name__}: {error}'))
+
+            if payments != paid or held:
+                self.stdout.write(self.style.ERROR('Inconsistent checkout state'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Checkout state consistent'))
@@ -0,0 +1,78 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from pos.management.benchmark import scratch_database, summarize_latencies
+from pos.models import Reservation, Table
+from pos.reservations import available_tables, turn_time
+
+
+class Command(BaseCommand):
+    help = 'Time the table availability query against many tables and bookings on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tables', type=int, default=300)
+        parser.add_argument('--bookings', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=30, help='Days the bookings are spread over')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--budget-ms', type=float, default=50, help='Fail if p95 latency exceeds this')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        with scratch_database():
+            Table.objects.bulk_create([
+                Table(number=n, seats=rng.choice([2, 2, 4, 4, 4, 6, 8])) for n in range(1, options['tables'] + 1)
+            ])
+            tables = list(Table.objects.all())
+            base = timezone.now().replace(hour=17, minute=0, second=0, microsecond=0)
+
+            def random_slot():
+                start = base + timedelta(days=rng.randrange(options['days']), minutes=15 * rng.randrange(24))
+                return start, start + timedelta(minutes=rng.choice([60, 90, 120]))
+
+            bookings = []
+            for _ in range(options['bookings']):
+                start, end = random_slot()
+                table = rng.choice(tables)
+                bookings.append(Reservation(
+                    table=table, customer_name='Bench', party_size=min(table.seats, 4), start=start, end=end,
+                ))
+            Reservation.objects.bulk_create(bookings)
+
+            # Brute-force reference for checking the indexed query
+            by_table = {}
+            for booking in bookings:
+                by_table.setdefault(booking.table_id, []).append((booking.start, booking.end))
+            turn = turn_time()
+
+            def expected(party_size, start, end):
+                return sorted(
+                    table.id for table in tables
+                    if table.seats >= party_size and not any(
+                        s < end + turn and e > start - turn for s, e in by_table.get(table.id, [])
+                    )
+                )
+
+            latencies, mismatches = [], 0
+            for _ in range(options['queries']):
+                party_size = rng.randint(1, 8)
+                start, end = random_slot()
+                started = time.perf_counter()
+                found = list(available_tables(party_size, start, end).values_list('id', flat=True))
+                latencies.append(time.perf_counter() - started)
+                if sorted(found) != expected(party_size, start, end):
+                    mismatches += 1
+
+            stats = summarize_latencies(latencies)
+            self.stdout.write(f'backend: {connection.vendor}, tables: {len(tables)}, bookings: {len(bookings)}')
+            self.stdout.write('latency ms: p50 {p50:.2f}, p95 {p95:.2f}, max {max:.2f}'.format(**stats))
+            self.stdout.write(f'queries: {len(latencies)}, wrong answers: {mismatches}')
+
+            if mismatches or stats['p95'] > options['budget_ms']:
+                self.stdout.write(self.style.ERROR('Availability query too slow or wrong'))
+            else:
+                self.stdout.write(self.style.SUCCESS('Availability query within budget'))
@@ -0,0 +1,113 @@
+import logging
+import re
+import tempfile
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from pos.events import flush_events
+from pos.management.benchmark import (
+    BUDGETS, DEFAULT_BUDGET, WRITE_BUDGETS, budget_objects, budget_posts, budget_urls, scratch_database,
+    seed_budget_data,
+)
+
+
+def normalize(sql):
+    return re.sub(r'\b\d+\b', '?', sql)
+
+
+class Command(BaseCommand):
+    help = (
+        'Check every POS page, admin changelist and ordering/payment write against a query count '
+        'and time budget at two data sizes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='20,200', help='Comma separated order counts to seed')
+        parser.add_argument('--max-ms', type=float, default=500, help='Time budget per request at the largest scale')
+        parser.add_argument('--show-sql', type=int, default=10, help='Statements to print per failing page')
+
+    def measure(self, scale):
+        """{request name: (path, status, [sql], seconds, budget)} for one data size"""
+        results = {}
+        with scratch_database():
+            user, orders, menu_items, tables = seed_budget_data(scale)
+            flush_events()
+            objects = budget_objects(orders, menu_items, tables)
+            # Report a crashing page as a 500 instead of aborting the whole run
+            client = Client(raise_request_exception=False)
+            client.force_login(user)
+            requests = [
+                (name, path, BUDGETS.get(name, DEFAULT_BUDGET), lambda path=path: client.get(path))
+                for name, path in budget_urls(objects)
+            ] + [
+                (f'POST {name}', path, WRITE_BUDGETS[name],
+                 lambda path=path, data=data, content_type=content_type: client.post(
+                     path, data, **({'content_type': content_type} if content_type else {}),
+                 ))
+                for name, path, data, content_type in budget_posts(objects)
+            ]
+            for name, path, budget, send in requests:
+                # Measure cold: cached views must stay within budget when they rebuild
+                for alias in settings.CACHES:
+                    caches[alias].clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = send()
+                    elapsed = time.perf_counter() - started
+                results[name] = (
+                    path, response.status_code, [q['sql'] for q in captured.captured_queries], elapsed, budget,
+                )
+        return results
+
+    def handle(self, *args, **options):
+        scales = sorted(int(scale) for scale in options['scales'].split(','))
+        # Keep the check's cache and metric writes away from the real ones
+        # 4xx answers to bare GETs are expected, only log server errors
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        with tempfile.TemporaryDirectory(prefix='pos-budget-') as tmpdir, override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            CACHES={
+                'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budget'},
+                'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'budget-shared'},
+            },
+            POS_SETTINGS=dict(settings.POS_SETTINGS, METRICS_DIR=tmpdir),
+        ):
+            runs = [(scale, self.measure(scale)) for scale in scales]
+
+        (small_scale, small), (large_scale, large) = runs[0], runs[-1]
+        failures = 0
+        self.stdout.write(f'{"page":<45} {"status":>6} {small_scale:>8} {large_scale:>8} {"budget":>7} {"ms":>8}')
+        for name, (path, status, queries, elapsed, budget) in large.items():
+            before = len(small[name][2])
+            problems = []
+            if status >= 500:
+                problems.append(f'status {status}')
+            if len(queries) > budget:
+                problems.append(f'{len(queries)} queries, budget {budget}')
+            if len(queries) > before:
+                problems.append(f'grew from {before} to {len(queries)} queries with more data')
+            if elapsed * 1000 > options['max_ms']:
+                problems.append(f'took {elapsed * 1000:.0f} ms')
+
+            line = f'{name:<45} {status:>6} {before:>8} {len(queries):>8} {budget:>7} {elapsed * 1000:>8.1f}'
+            if not problems:
+                self.stdout.write(line)
+                continue
+
+            failures += 1
+            self.stdout.write(self.style.ERROR(f'{line}  {"; ".join(problems)}'))
+            # Repeated statements are the usual culprit (N+1 queries), show those first
+            repeated = Counter(normalize(sql) for sql in queries)
+            for sql, count in repeated.most_common(options['show_sql']):
+                self.stdout.write(f'    {count:>4}x {sql}')
+
+        if failures:
+            raise CommandError(f'{failures} of {len(large)} requests over budget')
+        self.stdout.write(self.style.SUCCESS(f'All {len(large)} requests within budget'))
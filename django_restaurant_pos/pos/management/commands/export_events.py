@@ -0,0 +1,36 @@
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.base import BaseCommand
+
+from pos.events import flush_events, replay
+
+
+class Command(BaseCommand):
+    help = 'Export the order event log as JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Output file, defaults to stdout')
+        parser.add_argument('--since', type=int, default=0, help='Only events with a greater id')
+        parser.add_argument('--type', action='append', dest='types', help='Event type to include, repeatable')
+
+    def handle(self, *args, **options):
+        flush_events()
+        out = open(options['path'], 'w', encoding='utf-8') if options['path'] else self.stdout
+        count = 0
+        try:
+            for event in replay(options['since'], options['types']):
+                out.write(json.dumps({
+                    'id': event.id,
+                    'type': event.event_type,
+                    'order_id': event.order_id,
+                    'table_id': event.table_id,
+                    'data': event.data,
+                    'created_at': event.created_at,
+                }, cls=DjangoJSONEncoder) + '\n')
+                count += 1
+        finally:
+            if options['path']:
+                out.close()
+        if options['path']:
+            self.stdout.write(self.style.SUCCESS(f'Exported {count} events to {options["path"]}'))
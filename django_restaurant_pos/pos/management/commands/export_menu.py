@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from pos.menu_io import detect_format, export_menu
+
+
+class Command(BaseCommand):
+    help = 'Export the menu as CSV or JSON in the format accepted by import_menu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help='Output file, defaults to stdout')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension, or csv')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (detect_format(path) if path else 'csv')
+        content = export_menu(fmt)
+
+        if path:
+            with open(path, 'w', encoding='utf-8', newline='') as f:
+                f.write(content)
+            self.stdout.write(self.style.SUCCESS(f'Menu exported to {path}'))
+        else:
+            self.stdout.write(content, ending='')
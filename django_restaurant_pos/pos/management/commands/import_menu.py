@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pos.menu_io import MenuImportError, detect_format, import_menu
+
+
+class Command(BaseCommand):
+    help = 'Import a menu from a CSV or JSON file, creating, updating and deactivating items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON menu file')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension')
+        parser.add_argument('--dry-run', action='store_true', help='Show the changes without applying them')
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or detect_format(options['path'])
+        try:
+            with open(options['path'], encoding='utf-8') as f:
+                diff = import_menu(f.read(), fmt, dry_run=options['dry_run'])
+        except OSError as e:
+            raise CommandError(str(e))
+        except MenuImportError as e:
+            raise CommandError(f'Menu import failed: {e}')
+
+        for key, count in diff.summary().items():
+            self.stdout.write(f"{key.replace('_', ' ')}: {count}")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run, no changes applied'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Menu imported'))
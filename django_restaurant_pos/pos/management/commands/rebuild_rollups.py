@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pos.events import flush_events, update_rollups
+
+
+class Command(BaseCommand):
+    help = 'Replay the order event log into daily sales rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Discard existing rollups and replay every event')
+
+    def handle(self, *args, **options):
+        flush_events()
+        rollups = update_rollups(rebuild=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(rollups)} daily rollups'))
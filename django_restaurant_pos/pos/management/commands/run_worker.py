@@ -0,0 +1,69 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pos.tasks import claim_tasks, queue_metrics, requeue_stale, run_task, schedule_periodic
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks on a thread pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--no-periodic', action='store_true', help="Don't queue periodic tasks")
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        threads = options['threads']
+        idle = threading.Semaphore(threads)
+        last_queued = {}
+
+        def run(task_row):
+            try:
+                run_task(task_row)
+            finally:
+                connections.close_all()
+                idle.release()
+
+        requeued = requeue_stale()
+        if requeued:
+            self.stdout.write(f'Requeued {requeued} stale tasks')
+        self.stdout.write(f'Worker {worker} started with {threads} threads')
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            try:
+                while True:
+                    if not options['no_periodic']:
+                        schedule_periodic(last_queued)
+
+                    # Only claim as many tasks as there are free threads
+                    if not idle.acquire(timeout=options['poll']):
+                        continue
+                    free = 1
+                    while free < threads and idle.acquire(blocking=False):
+                        free += 1
+
+                    claimed = claim_tasks(worker, limit=free)
+                    for _ in range(free - len(claimed)):
+                        idle.release()
+                    for task_row in claimed:
+                        pool.submit(run, task_row)
+
+                    if not claimed:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll'])
+            except KeyboardInterrupt:
+                self.stdout.write('Stopping, waiting for running tasks')
+
+        metrics = queue_metrics()
+        self.stdout.write(
+            'Worker stopped: {succeeded} succeeded, {retried} retried, {failed} failed'.format(**metrics['worker'])
+        )
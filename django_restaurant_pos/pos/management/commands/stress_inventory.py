@@ -0,0 +1,87 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from pos.events import flush_events
+from pos.inventory import OutOfStock, is_sold_out, set_stock, stock_levels
+from pos.management.benchmark import scratch_database, seed_menu, seed_orders, seed_user, summarize_latencies
+from pos.models import OrderItem, StockShard
+from pos.orders import add_item, change_status
+
+
+class Command(BaseCommand):
+    help = 'Race concurrent orders for a limited-stock item on a scratch database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stock', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--quantity', type=int, default=1, help='Portions each order asks for')
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            user = seed_user()
+            menu_items = seed_menu(categories=1, items_per_category=2)
+            orders = seed_orders(options['orders'], menu_items[1:], user=user, items_per_order=1)
+            item = menu_items[0]
+            set_stock(item.id, options['stock'])
+
+            latencies, sold_out, failures = [], [], []
+
+            def order(order_row):
+                started = time.perf_counter()
+                try:
+                    add_item(order_row, item, options['quantity'])
+                    latencies.append(time.perf_counter() - started)
+                except OutOfStock:
+                    sold_out.append(order_row.id)
+                except Exception as e:
+                    failures.append(e)
+                finally:
+                    connections.close_all()
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                list(pool.map(order, orders))
+            elapsed = time.perf_counter() - started
+
+            expected = min(options['stock'] // options['quantity'], len(orders))
+            left = stock_levels([item.id]).get(item.id, 0)
+            portions = sum(OrderItem.objects.filter(menu_item=item).values_list('quantity', flat=True))
+            negative = StockShard.objects.filter(quantity__lt=0).count()
+            available = not is_sold_out(item.id)
+            stats = summarize_latencies(latencies)
+
+            self.stdout.write(f'backend: {connection.vendor}, workers: {options["workers"]}')
+            self.stdout.write(
+                f'stock: {options["stock"]}, orders: {len(orders)}, succeeded: {len(latencies)}, '
+                f'sold out: {len(sold_out)}, errors: {len(failures)}'
+            )
+            self.stdout.write(f'throughput: {len(orders) / elapsed:.1f} orders/s')
+            self.stdout.write('latency ms: p50 {p50:.2f}, p95 {p95:.2f}, max {max:.2f}'.format(**stats))
+            self.stdout.write(f'portions ordered: {portions}, left: {left}, item available: {available}')
+            for error in failures[:5]:
+                self.stdout.write(self.style.ERROR(f'{type(error).__name__}: {error}'))
+
+            consistent = (
+                len(latencies) == expected and not negative and not failures
+                and portions + left == options['stock']
+                and available == (left > 0)
+            )
+
+            # Cancelling a sold order must put its portions back
+            if latencies:
+                sold = OrderItem.objects.filter(menu_item=item).select_related('order').first().order
+                change_status(sold, 'cancelled')
+                restored = stock_levels([item.id]).get(item.id, 0)
+                consistent = consistent and restored == left + options['quantity']
+                consistent = consistent and not is_sold_out(item.id)
+                self.stdout.write(f'after cancelling one order: {restored} left')
+
+            flush_events()
+            if consistent:
+                self.stdout.write(self.style.SUCCESS('Inventory state consistent'))
+            else:
+                self.stdout.write(self.style.ERROR('Inconsistent inventory state'))
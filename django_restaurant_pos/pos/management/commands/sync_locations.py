@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from pos.locations import mirror_databases, sync_shared_rows
+
+
+class Command(BaseCommand):
+    help = 'Copy users and the shared menu into every location database'
+
+    def handle(self, *args, **options):
+        aliases = mirror_databases()
+        if not aliases:
+            self.stdout.write('Only one location database configured, nothing to sync')
+            return
+        copied = sync_shared_rows()
+        self.stdout.write(self.style.SUCCESS(f'Synced {copied} rows into {", ".join(aliases)}'))
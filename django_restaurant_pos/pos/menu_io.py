@@ -0,0 +1,312 @@
+"""Bulk menu import/export in CSV or JSON.
+
+Both formats carry the same flat rows, one per menu item, so an export can be
+edited and fed straight back into an import. Exports include each category's
+id, so an import matches categories by id (and can rename them); files
+without ids match categories by name.
+"""
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .cache import invalidate
+from .locations import get_current_location, mirror_databases
+from .models import Category, MenuItem
+from .tasks import enqueue, sync_shared_rows_task
+
+
+MENU_FIELDS = [
+    'category_id',
+    'category',
+    'category_description',
+    'category_is_active',
+    'name',
+    'description',
+    'price',
+    'is_available',
+]
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+
+
+class MenuImportError(ValueError):
+    """Raised when an import file cannot be parsed or validated"""
+
+
+@dataclass
+class MenuDiff:
+    """Changes an import would apply to the current menu"""
+    categories_created: list = field(default_factory=list)
+    categories_updated: list = field(default_factory=list)
+    categories_deactivated: list = field(default_factory=list)
+    items_created: list = field(default_factory=list)
+    items_updated: list = field(default_factory=list)
+    items_deactivated: list = field(default_factory=list)
+
+    @property
+    def has_changes(self):
+        return any([
+            self.categories_created, self.categories_updated, self.categories_deactivated,
+            self.items_created, self.items_updated, self.items_deactivated,
+        ])
+
+    def summary(self):
+        return {
+            'categories_created': len(self.categories_created),
+            'categories_updated': len(self.categories_updated),
+            'categories_deactivated': len(self.categories_deactivated),
+            'items_created': len(self.items_created),
+            'items_updated': len(self.items_updated),
+            'items_deactivated': len(self.items_deactivated),
+        }
+
+
+def detect_format(filename):
+    """Guess the file format from its extension"""
+    return 'json' if filename.lower().endswith('.json') else 'csv'
+
+
+def export_rows():
+    """Current menu as flat rows, ordered by category then item name"""
+    items = MenuItem.objects.select_related('category').order_by('category__name', 'name')
+    return [
+        {
+            'category_id': item.category_id,
+            'category': item.category.name,
+            'category_description': item.category.description,
+            'category_is_active': item.category.is_active,
+            'name': item.name,
+            'description': item.description,
+            'price': str(item.price),
+            'is_available': item.is_available,
+        }
+        for item in items
+    ]
+
+
+def export_menu(fmt='csv'):
+    """Serialize the menu to a CSV or JSON string"""
+    rows = export_rows()
+    if fmt == 'json':
+        return json.dumps(rows, indent=2)
+
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=MENU_FIELDS)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(dict(
+            row,
+            category_is_active='true' if row['category_is_active'] else 'false',
+            is_available='true' if row['is_available'] else 'false',
+        ))
+    return output.getvalue()
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def parse_menu(content, fmt='csv'):
+    """Parse and validate an import file into normalized rows"""
+    if fmt == 'json':
+        try:
+            raw_rows = json.loads(content)
+        except ValueError as e:
+            raise MenuImportError(f'Invalid JSON: {e}')
+        if not isinstance(raw_rows, list):
+            raise MenuImportError('JSON menu must be a list of items')
+    else:
+        raw_rows = list(csv.DictReader(io.StringIO(content)))
+
+    rows = []
+    seen = set()
+    # Each category name must stand for one category and each id carry one name
+    ids_by_name, names_by_id = {}, {}
+    for line, raw in enumerate(raw_rows, start=1):
+        if not isinstance(raw, dict):
+            raise MenuImportError(f'Row {line}: expected an object')
+        category = str(raw.get('category') or '').strip()
+        name = str(raw.get('name') or '').strip()
+        if not category or not name:
+            raise MenuImportError(f'Row {line}: category and name are required')
+        if (category, name) in seen:
+            raise MenuImportError(f'Row {line}: duplicate item "{name}" in "{category}"')
+        seen.add((category, name))
+
+        category_id = raw.get('category_id')
+        if category_id in (None, ''):
+            category_id = None
+        else:
+            try:
+                category_id = int(category_id)
+            except (TypeError, ValueError):
+                raise MenuImportError(f'Row {line}: invalid category_id "{category_id}"')
+        if ids_by_name.setdefault(category, category_id) != category_id:
+            raise MenuImportError(f'Row {line}: duplicate category name "{category}"')
+        if category_id is not None and names_by_id.setdefault(category_id, category) != category:
+            raise MenuImportError(f'Row {line}: category {category_id} has more than one name')
+
+        try:
+            price = Decimal(str(raw.get('price'))).quantize(Decimal('0.01'))
+        except (InvalidOperation, TypeError):
+            raise MenuImportError(f'Row {line}: invalid price "{raw.get("price")}"')
+        if price < 0:
+            raise MenuImportError(f'Row {line}: price cannot be negative')
+
+        is_available = _parse_bool(raw.get('is_available', True))
+        rows.append({
+            'category_id': category_id,
+            'category': category,
+            'category_description': str(raw.get('category_description') or ''),
+            'category_is_active': _parse_bool(raw.get('category_is_active', True)),
+            'name': name,
+            'description': str(raw.get('description') or ''),
+            'price': price,
+            'is_available': is_available,
+        })
+    return rows
+
+
+def diff_menu(rows):
+    """Compare imported rows against the current categories and items.
+
+    Categories are matched by id when the file has one, otherwise by name,
+    and items by (category, name). A name shared by several categories is
+    ambiguous and rejected. Items missing from the file are deactivated
+    rather than deleted, since existing orders still reference them.
+    Categories keep the active state the file gives them; a category with
+    no rows in the file is left as it is.
+    """
+    diff = MenuDiff()
+    categories = {c.id: c for c in Category.objects.all()}
+    categories_by_name = {}
+    for category in categories.values():
+        categories_by_name.setdefault(category.name, []).append(category)
+    items = {(item.category_id, item.name): item for item in MenuItem.objects.all()}
+
+    # The category each row goes to, existing or new, by the name in the file
+    targets = {}
+    for row in rows:
+        if row['category'] in targets:
+            continue
+        category = categories.get(row['category_id'])
+        if category is None:
+            # No id, or an id from another database: fall back to the name
+            matches = categories_by_name.get(row['category'], [])
+            if len(matches) > 1:
+                raise MenuImportError(
+                    f'Category name "{row["category"]}" is used by {len(matches)} categories, '
+                    'add category_id to say which one'
+                )
+            category = matches[0] if matches else None
+        if category is not None and category in targets.values():
+            raise MenuImportError(f'Category "{category.name}" appears under more than one name')
+
+        description, is_active = row['category_description'], row['category_is_active']
+        if category is None:
+            category = Category(name=row['category'], description=description, is_active=is_active)
+            diff.categories_created.append(category)
+        elif category.is_active and not is_active:
+            category.name = row['category']
+            category.description = description
+            category.is_active = False
+            diff.categories_deactivated.append(category)
+        elif (category.name != row['category'] or category.description != description
+              or category.is_active != is_active):
+            category.name = row['category']
+            category.description = description
+            category.is_active = is_active
+            diff.categories_updated.append(category)
+        targets[row['category']] = category
+
+    imported = {category.id for category in targets.values()}
+    for category in diff.categories_updated + diff.categories_deactivated:
+        # A rename must not take the name of a category left out of the file
+        if any(other.id not in imported for other in categories_by_name.get(category.name, [])):
+            raise MenuImportError(f'Category name "{category.name}" is already used by another category')
+
+    imported_keys = set()
+    for row in rows:
+        row['category_obj'] = category = targets[row['category']]
+        key = (category.id, row['name'])
+        imported_keys.add(key)
+        item = items.get(key) if category.id else None
+        if item is None:
+            diff.items_created.append(row)
+        elif (item.description != row['description'] or item.price != row['price']
+              or item.is_available != row['is_available']):
+            item.description = row['description']
+            item.price = row['price']
+            item.is_available = row['is_available']
+            diff.items_updated.append(item)
+
+    for key, item in items.items():
+        if key not in imported_keys and item.is_available:
+            item.is_available = False
+            diff.items_deactivated.append(item)
+
+    return diff
+
+
+def apply_menu_diff(diff):
+    """Write a diff with bulk operations inside a single transaction"""
+    using = router.db_for_write(MenuItem)
+    with transaction.atomic(using=using):
+        Category.objects.bulk_create(diff.categories_created)
+        Category.objects.bulk_update(
+            diff.categories_updated + diff.categories_deactivated,
+            ['name', 'description', 'is_active'],
+        )
+        # Backends that cannot return ids from a bulk insert leave them unset;
+        # new category names are unique, so look those up by name
+        missing = [category for category in diff.categories_created if category.id is None]
+        if missing:
+            new_ids = dict(
+                Category.objects.filter(name__in=[category.name for category in missing])
+                .values_list('name', 'id')
+            )
+            for category in missing:
+                category.id = new_ids[category.name]
+
+        MenuItem.objects.bulk_create([
+            MenuItem(
+                name=row['name'],
+                description=row['description'],
+                price=row['price'],
+                is_available=row['is_available'],
+                category_id=row['category_obj'].id,
+            )
+            for row in diff.items_created
+        ])
+        # bulk_update skips auto_now, so set updated_at explicitly
+        changed_items = diff.items_updated + diff.items_deactivated
+        now = timezone.now()
+        for item in changed_items:
+            item.updated_at = now
+        MenuItem.objects.bulk_update(
+            changed_items,
+            ['description', 'price', 'is_available', 'updated_at'],
+        )
+        # Bulk writes skip the save signals, so drop menu caches once here
+        transaction.on_commit(lambda: invalidate('menu'), using=using)
+        # ...and mirror a shared menu from the background
+        if mirror_databases():
+            transaction.on_commit(lambda: enqueue(
+                sync_shared_rows_task, dedupe_key=f'{sync_shared_rows_task.task_name}:{get_current_location()}',
+            ), using=using)
+    return diff
+
+
+def import_menu(content, fmt='csv', dry_run=False):
+    """Parse, diff and (unless dry_run) apply a menu file"""
+    diff = diff_menu(parse_menu(content, fmt))
+    if not dry_run and diff.has_changes:
+        apply_menu_diff(diff)
+    return diff
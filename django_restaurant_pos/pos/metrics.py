@@ -0,0 +1,287 @@
+"""Operational metrics in the Prometheus text format.
+
+Counters and histograms live in memory and are cheap to update from views.
+Every web or worker process writes its values to its own JSON file under
+``POS_SETTINGS['METRICS_DIR']`` at most once per ``FLUSH_INTERVAL``. Each
+write goes to a temporary file that is then renamed over the old one, so a
+reader never sees a half-written file. The ``/metrics/`` endpoint merges
+all files, so the totals cover every process, and adds gauges read from the
+database at scrape time (kitchen queue, tables, task queue).
+
+Files of processes that have exited are kept, so counters never go
+backwards; clear the directory when deploying.
+"""
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.models import Count
+
+from .locations import get_current_location, get_locations, use_location
+
+FLUSH_INTERVAL = 1.0
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SERVE_BUCKETS = (60, 300, 600, 900, 1200, 1800, 2700, 3600, 7200)
+
+_lock = threading.Lock()
+_registry = {}
+_process_file = f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+_last_flush = 0.0
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        # A location label defaults to the location of the current request
+        if 'location' in self.labels and 'location' not in labels:
+            labels['location'] = get_current_location()
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dump(self):
+        return {'type': self.kind, 'help': self.help, 'labels': self.labels,
+                'samples': [[list(key), list(value) if isinstance(value, list) else value]
+                            for key, value in self.values.items()]}
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            # Per-bucket counts followed by the sum and the count
+            sample = self.values.get(key)
+            if sample is None:
+                sample = self.values[key] = [0] * (len(self.buckets) + 2)
+            sample[bisect.bisect_left(self.buckets, value)] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def dump(self):
+        data = super().dump()
+        data['buckets'] = self.buckets
+        return data
+
+
+def counter(name, help_text, labels=()):
+    return _registry.setdefault(name, Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return _registry.setdefault(name, Histogram(name, help_text, labels, buckets))
+
+
+# Business metrics
+orders_created = counter('pos_orders_created_total', 'Orders opened', ['location'])
+order_status_changes = counter('pos_order_status_changes_total', 'Order status changes', ['location', 'status'])
+pending_to_served = histogram(
+    'pos_order_pending_to_served_seconds', 'Time from opening an order to serving it', ['location'], SERVE_BUCKETS,
+)
+items_added = counter('pos_order_items_added_total', 'Portions added to orders', ['location'])
+add_item_failures = counter('pos_add_item_failures_total', 'Failed add-item requests', ['location', 'reason'])
+payments = counter('pos_payments_total', 'Payment attempts', ['location', 'method', 'outcome'])
+payment_seconds = histogram('pos_payment_seconds', 'Time to process a payment', ['location'])
+table_status_changes = counter('pos_table_status_changes_total', 'Table status changes', ['location', 'status'])
+sync_operations = counter(
+    'pos_sync_operations_total', 'Queued terminal operations by outcome', ['location', 'op', 'outcome'],
+)
+
+# Request metrics, recorded by MetricsMiddleware
+requests_total = counter('pos_http_requests_total', 'Requests by view and status class', ['view', 'method', 'status'])
+request_errors = counter('pos_http_errors_total', 'Requests answered with a server error', ['view'])
+request_seconds = histogram('pos_http_request_seconds', 'Request latency by view', ['view'])
+
+
+def metrics_dir():
+    return str(settings.POS_SETTINGS.get('METRICS_DIR') or os.path.join(settings.BASE_DIR, 'metrics'))
+
+
+def snapshot():
+    with _lock:
+        return {name: metric.dump() for name, metric in _registry.items()}
+
+
+def flush(force=False):
+    """Write this process's metrics to its file, at most once per FLUSH_INTERVAL"""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    if not any(metric.values for metric in _registry.values()):
+        return
+    _last_flush = now
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp_path, os.path.join(directory, _process_file))
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+atexit.register(flush, force=True)
+
+
+def merged():
+    """Metrics of every process, counters and histogram buckets summed"""
+    flush(force=True)
+    totals = {}
+    directory = metrics_dir()
+    # Nothing is written until a process records its first value
+    os.makedirs(directory, exist_ok=True)
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, metric in data.items():
+            merged_metric = totals.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                current = merged_metric['samples'].get(key)
+                if current is None:
+                    merged_metric['samples'][key] = value
+                elif metric['type'] == 'histogram':
+                    merged_metric['samples'][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    merged_metric['samples'][key] = current + value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(metrics):
+    lines = []
+    for name, metric in sorted(metrics.items()):
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        labels = metric['labels']
+        for key, value in sorted(metric['samples'].items()):
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(metric['buckets']) + ['+Inf'], value[:-2]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_label_text(labels, key, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_sum{_label_text(labels, key)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_label_text(labels, key)} {value[-1]}')
+            else:
+                lines.append(f'{name}{_label_text(labels, key)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def database_gauges():
+    """Gauges read from each location's database at scrape time"""
+    from .models import Order, Table, Task
+
+    kitchen = {'type': 'gauge', 'help': 'Open orders waiting on the kitchen or the pass',
+               'labels': ['location', 'status'], 'samples': {}}
+    tables = {'type': 'gauge', 'help': 'Tables by status', 'labels': ['location', 'status'], 'samples': {}}
+    for code in get_locations():
+        with use_location(code):
+            counts = dict(
+                Order.objects.filter(status__in=['pending', 'preparing', 'ready'])
+                .values_list('status').annotate(count=Count('id')).order_by()
+            )
+            for status in ('pending', 'preparing', 'ready'):
+                kitchen['samples'][(code, status)] = counts.get(status, 0)
+            for status, count in Table.objects.values_list('status').annotate(count=Count('id')).order_by():
+                tables['samples'][(code, status)] = count
+
+    task_queue = {'type': 'gauge', 'help': 'Background tasks by status', 'labels': ['status'], 'samples': {}}
+    for status, count in Task.objects.values_list('status').annotate(count=Count('id')).order_by():
+        task_queue['samples'][(status,)] = count
+
+    return {'pos_kitchen_queue_orders': kitchen, 'pos_tables': tables, 'pos_task_queue': task_queue}
+
+
+def exposition():
+    """Full scrape body: merged process metrics plus database gauges"""
+    metrics = merged()
+    metrics.update(database_gauges())
+    return render(metrics)
+
+
+class MetricsMiddleware:
+    """Count requests, server errors and latency per view"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    def record(self, request, response, started):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        request_seconds.observe(time.perf_counter() - started, view=view)
+        requests_total.inc(view=view, method=request.method, status=f'{response.status_code // 100}xx')
+        if response.status_code >= 500:
+            request_errors.inc(view=view)
+        # At most one small file write per second, cheap enough for the event loop
+        flush()
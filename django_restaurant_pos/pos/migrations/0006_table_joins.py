@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pos', '0005_reservations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='table',
+            name='joined_to',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='joined_tables', to='pos.table'),
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -45,6 +46,10 @@ class Table(models.Model):
     number = models.PositiveIntegerField(unique=True)
     seats = models.PositiveIntegerField(default=4)
     status = models.CharField(max_length=20, choices=TABLE_STATUSES, default='available')
+    # Set on tables pushed together for a large party, pointing at the table holding the order
+    joined_to = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='joined_tables'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -61,6 +66,7 @@ class Order(models.Model):
         ('paid', 'Paid'),
         ('cancelled', 'Cancelled'),
     ]
+    CLOSED_STATUSES = ['paid', 'cancelled']
     
     order_number = models.CharField(max_length=20, unique=True)
     table = models.ForeignKey(Table, on_delete=models.SET_NULL, null=True, blank=True)
@@ -81,18 +87,28 @@ class Order(models.Model):
         super().save(*args, **kwargs)
     
     def calculate_totals(self):
-        """Calculate subtotal, tax, and total for this order"""
+        """Calculate subtotal, tax, and total for this order.
+        
+        Only saves (and so only changes the order's version) when a
+        figure actually changed.
+        """
         from django.conf import settings
         
-        subtotal = sum(item.get_total() for item in self.orderitem_set.all())
+        subtotal = sum((item.get_total() for item in self.orderitem_set.all()), Decimal('0'))
         tax_rate = Decimal(str(settings.POS_SETTINGS.get('TAX_RATE', 0.08)))
-        tax_amount = subtotal * tax_rate
+        tax_amount = (subtotal * tax_rate).quantize(Decimal('0.01'))
         total = subtotal + tax_amount
         
-        self.subtotal = subtotal
-        self.tax_amount = tax_amount
-        self.total = total
-        self.save()
+        if (self.subtotal, self.tax_amount, self.total) != (subtotal, tax_amount, total):
+            self.subtotal = subtotal
+            self.tax_amount = tax_amount
+            self.total = total
+            self.save(update_fields=['subtotal', 'tax_amount', 'total', 'updated_at'])
+    
+    @classmethod
+    def touch(cls, order_id):
+        """Bump an order's updated_at, its version for conditional requests"""
+        cls.objects.filter(id=order_id).update(updated_at=timezone.now())
     
     def __str__(self):
         return f"Order {self.order_number} - ${self.total}"
@@ -112,8 +128,18 @@ class OrderItem(models.Model):
     
     def save(self, *args, **kwargs):
         if not self.unit_price:
-            self.unit_price = self.menu_item.price
+            # Read just the price unless the menu item is already loaded
+            if OrderItem.menu_item.is_cached(self):
+                self.unit_price = self.menu_item.price
+            else:
+                self.unit_price = MenuItem.objects.values_list('price', flat=True).get(id=self.menu_item_id)
         super().save(*args, **kwargs)
+        Order.touch(self.order_id)
+    
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Order.touch(self.order_id)
+        return result
     
     def __str__(self):
         return f"{self.quantity}x {self.menu_item.name}"
@@ -135,4 +161,187 @@ class Payment(models.Model):
     processed_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"Payment for {self.order.order_number} - ${self.amount}"
\ No newline at end of file
+        return f"Payment for {self.order.order_number} - ${self.amount}"
+
+
+class OrderEvent(models.Model):
+    """Append-only log of changes to orders, items, payments and tables"""
+    EVENT_TYPES = [
+        ('order_created', 'Order Created'),
+        ('item_added', 'Item Added'),
+        ('status_changed', 'Status Changed'),
+        ('paid', 'Paid'),
+        ('table_status_changed', 'Table Status Changed'),
+    ]
+    
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPES)
+    # Plain ids rather than foreign keys so the log outlives deleted rows
+    order_id = models.BigIntegerField(null=True, blank=True, db_index=True)
+    table_id = models.BigIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.get_event_type_display()} #{self.id}"
+
+
+class DailySalesRollup(models.Model):
+    """Per-day sales figures rebuilt by replaying the order event log"""
+    date = models.DateField(unique=True)
+    orders_created = models.PositiveIntegerField(default=0)
+    orders_paid = models.PositiveIntegerField(default=0)
+    orders_cancelled = models.PositiveIntegerField(default=0)
+    items_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_quantities = models.JSONField(default=dict)
+    last_event_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def top_items(self, limit=5):
+        return sorted(self.item_quantities.items(), key=lambda item: item[1], reverse=True)[:limit]
+    
+    def __str__(self):
+        return f"Sales {self.date} - ${self.revenue}"
+
+
+class Task(models.Model):
+    """Background job queued by views and run by the `run_worker` command"""
+    TASK_STATUSES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+    kwargs = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    location = models.CharField(max_length=50, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text='Higher runs first')
+    status = models.CharField(max_length=20, choices=TASK_STATUSES, default='queued')
+    dedupe_key = models.CharField(max_length=200, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_after'], name='pos_task_queue_idx'),
+        ]
+        constraints = [
+            # Only one queued task per dedupe key; a copy may queue while one runs
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='queued') & ~models.Q(dedupe_key=''),
+                name='pos_task_queued_dedupe_key',
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class StockShard(models.Model):
+    """One slice of a menu item's portion count.
+    
+    Stock is split over several rows so concurrent orders for the same item
+    decrement different rows instead of queueing on one. Items without
+    shards are not stock-tracked.
+    """
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='stock_shards')
+    shard = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['menu_item', 'shard'], name='pos_stock_shard_unique'),
+        ]
+    
+    def __str__(self):
+        return f"{self.menu_item.name} shard {self.shard}: {self.quantity}"
+
+
+class Reservation(models.Model):
+    """A party booked onto a table for a time slot"""
+    RESERVATION_STATUSES = [
+        ('booked', 'Booked'),
+        ('seated', 'Seated'),
+        ('cancelled', 'Cancelled'),
+        ('no_show', 'No Show'),
+    ]
+    ACTIVE_STATUSES = ['booked', 'seated']
+    
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name='reservations')
+    customer_name = models.CharField(max_length=100)
+    phone = models.CharField(max_length=30, blank=True)
+    party_size = models.PositiveIntegerField()
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=RESERVATION_STATUSES, default='booked')
+    notes = models.TextField(blank=True)
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['start']
+        indexes = [
+            # Overlap checks are a short range scan per table on start
+            models.Index(fields=['table', 'start', 'end'], name='pos_reservation_slot_idx'),
+            models.Index(fields=['start'], name='pos_reservation_start_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer_name} ({self.party_size}) at Table {self.table.number}, {self.start:%Y-%m-%d %H:%M}"
+
+
+class SyncOperation(models.Model):
+    """Stored result of an operation sent by a terminal, so a retry is not applied twice.
+    
+    Rows are keyed on a 64-bit hash of the terminal's idempotency key rather
+    than the key itself, keeping the unique index at eight bytes per entry.
+    """
+    key_hash = models.BigIntegerField(unique=True)
+    response = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    def __str__(self):
+        return f"Sync operation {self.key_hash}"
+
+
+class DayClose(models.Model):
+    """Frozen end-of-day figures (Z-report) for one business date.
+    
+    Written once by ``closing.close_day`` and never updated, so reports and
+    reprints for a closed day read this row instead of the day's orders.
+    """
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    sales = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    tax = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    mismatches = models.PositiveIntegerField(default=0)
+    report = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    closed_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-date']
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError(f'{self.date} is closed and its figures cannot be changed')
+        super().save(*args, **kwargs)
+    
+    def __str__(self):
+        return f"Close {self.date} - ${self.sales}"
@@ -0,0 +1,102 @@
+"""Order operations shared by the views: adding items and changing status"""
+from django.db import router, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .allocation import set_table_status
+from .cache import invalidate
+from .events import record_event
+from .inventory import release_order, reserve, reserve_order
+from .models import Order, OrderItem
+
+
+class OrderError(Exception):
+    """Raised when an order operation is not allowed"""
+
+
+def add_item(order, menu_item, quantity=1, special_instructions=''):
+    """Add portions of a menu item to an order and recalculate its totals.
+
+    Stock is reserved in the same transaction as the item row, so an
+    OutOfStock error leaves both untouched. Paid and cancelled orders are
+    closed to new items. Returns the OrderItem.
+    """
+    if quantity < 1:
+        raise OrderError('Quantity must be at least 1')
+    if order.status in Order.CLOSED_STATUSES:
+        raise OrderError(f'Order {order.order_number} is {order.status}, items cannot be added')
+
+    with transaction.atomic(using=router.db_for_write(OrderItem)):
+        # Conditional so an order closed on another terminal since it was read
+        # takes no items. Writing first also takes SQLite's write lock before
+        # any read, and bumps the order's version.
+        if not Order.objects.filter(id=order.id).exclude(status__in=Order.CLOSED_STATUSES).update(
+            updated_at=timezone.now(),
+        ):
+            raise OrderError('Order was closed on another terminal, please reload')
+
+        updates = {'quantity': F('quantity') + quantity}
+        if special_instructions:
+            updates['special_instructions'] = special_instructions
+        # Increment in SQL so two terminals adding the same dish both count
+        updated = OrderItem.objects.filter(order=order, menu_item=menu_item).update(**updates)
+        reserve(menu_item.id, quantity)
+
+        if updated:
+            order_item = OrderItem.objects.get(order=order, menu_item=menu_item)
+        else:
+            order_item = OrderItem.objects.create(
+                order=order,
+                menu_item=menu_item,
+                quantity=quantity,
+                unit_price=menu_item.price,
+                special_instructions=special_instructions,
+            )
+
+        order.calculate_totals()
+        record_event('item_added', order_id=order.id, table_id=order.table_id,
+                     menu_item_id=menu_item.id, name=menu_item.name,
+                     quantity=quantity, unit_price=order_item.unit_price)
+    return order_item
+
+
+def change_status(order, new_status):
+    """Move an order to a new status.
+
+    Cancelling gives the order's stock back and un-cancelling reserves it
+    again. Paid and cancelled orders free their table. A paid order is
+    final: its portions are sold and its payment recorded.
+    """
+    if new_status not in dict(Order.ORDER_STATUSES):
+        raise OrderError(f'Invalid status "{new_status}"')
+    if order.status == 'paid':
+        raise OrderError(f'Order {order.order_number} is paid, its status cannot change')
+
+    old_status = order.status
+    with transaction.atomic(using=router.db_for_write(Order)):
+        # Conditional so two terminals cancelling at once release stock only once
+        if not Order.objects.filter(id=order.id, status=old_status).update(
+            status=new_status, updated_at=timezone.now(),
+        ):
+            raise OrderError('Order was changed on another terminal, please reload')
+        order.status = new_status
+
+        if new_status == 'cancelled' and old_status != 'cancelled':
+            release_order(order.id)
+        elif old_status == 'cancelled' and new_status != 'cancelled':
+            reserve_order(order.id)
+
+        # A paid order carries its total so rollups count it like a checkout
+        extra = {'total': order.total} if new_status == 'paid' else {}
+        record_event('status_changed', order_id=order.id, table_id=order.table_id,
+                     **{'from': old_status, 'to': new_status}, **extra)
+
+        # Free table if order is completed or cancelled
+        freed = new_status in ['paid', 'cancelled'] and order.table_id
+        if freed:
+            set_table_status(order.table_id, 'available')
+            record_event('table_status_changed', table_id=order.table_id, order_id=order.id, status='available')
+
+    if freed:
+        invalidate('tables')
+    return order
@@ -0,0 +1,178 @@
+"""Table reservations and the availability query.
+
+A table is free for a slot when no active reservation on it overlaps the
+slot widened by the turn time needed to clear and reset the table.
+Bookings are capped at ``RESERVATION_MAX_MINUTES``, so only reservations
+starting within that window before the slot can overlap it. The overlap
+check is therefore a short range scan on the ``(table, start)`` index no
+matter how many bookings a table has.
+
+``promote_due_reservations`` marks tables reserved shortly before their
+bookings and releases the tables of parties that never showed up; the
+worker runs it every minute.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .cache import invalidate
+from .events import record_event
+from .models import Order, Reservation, Table
+
+
+class ReservationError(Exception):
+    """Raised when a booking cannot be made or changed"""
+
+
+def _minutes(name, default):
+    return timedelta(minutes=settings.POS_SETTINGS.get(name, default))
+
+
+def default_length():
+    return _minutes('RESERVATION_DEFAULT_MINUTES', 90)
+
+
+def max_length():
+    return _minutes('RESERVATION_MAX_MINUTES', 240)
+
+
+def turn_time():
+    return _minutes('RESERVATION_TURN_MINUTES', 15)
+
+
+def hold_time():
+    return _minutes('RESERVATION_HOLD_MINUTES', 30)
+
+
+def grace_time():
+    return _minutes('RESERVATION_GRACE_MINUTES', 15)
+
+
+def conflicting(start, end):
+    """Active reservations overlapping start-end, turn time included"""
+    turn = turn_time()
+    return Reservation.objects.filter(
+        status__in=Reservation.ACTIVE_STATUSES,
+        # Lower bound on start keeps this an index range scan
+        start__gt=start - turn - max_length(),
+        start__lt=end + turn,
+        end__gt=start - turn,
+    )
+
+
+def available_tables(party_size, start, end=None):
+    """Tables seating ``party_size`` that are free from start to end, smallest first"""
+    end = end or start + default_length()
+    booked = conflicting(start, end).filter(table=OuterRef('pk'))
+    return Table.objects.filter(seats__gte=party_size).filter(~Exists(booked)).order_by('seats', 'number')
+
+
+def book(table_id, party_size, start, end=None, customer_name='', phone='', notes='', user=None):
+    """Book a table for a slot, raising ReservationError if it is taken"""
+    end = end or start + default_length()
+    if party_size < 1:
+        raise ReservationError('Party size must be at least 1')
+    if end <= start:
+        raise ReservationError('A booking must end after it starts')
+    if end - start > max_length():
+        raise ReservationError(f'Bookings can be at most {int(max_length().total_seconds() // 60)} minutes')
+
+    with transaction.atomic(using=router.db_for_write(Reservation)):
+        # Insert first so SQLite takes its write lock before the checks read
+        reservation = Reservation.objects.create(
+            table_id=table_id,
+            party_size=party_size,
+            start=start,
+            end=end,
+            customer_name=customer_name,
+            phone=phone,
+            notes=notes,
+            created_by=user,
+        )
+        # Row lock so two hosts booking the same table are checked one after the other
+        table = Table.objects.select_for_update(no_key=True).filter(id=table_id).first()
+        if table is None:
+            raise ReservationError('Unknown table')
+        if table.seats < party_size:
+            raise ReservationError(f'Table {table.number} only seats {table.seats}')
+        if conflicting(start, end).filter(table_id=table_id).exclude(id=reservation.id).exists():
+            raise ReservationError(f'Table {table.number} is already booked around that time')
+
+    if start - timezone.now() <= hold_time():
+        promote_due_reservations()
+    return reservation
+
+
+def cancel(reservation_id, status='cancelled'):
+    """Cancel a booking (or mark it a no-show) and free its table if it was held"""
+    reservation = Reservation.objects.filter(id=reservation_id).select_related('table').first()
+    if reservation is None or not Reservation.objects.filter(id=reservation_id, status='booked').update(status=status):
+        raise ReservationError('Only booked reservations can be cancelled')
+    if _release_table(reservation.table_id):
+        invalidate('tables')
+    return reservation
+
+
+def seat(reservation_id, user=None):
+    """Seat a booked party: open an order on its table and mark the table occupied"""
+    with transaction.atomic(using=router.db_for_write(Reservation)):
+        if not Reservation.objects.filter(id=reservation_id, status='booked').update(status='seated'):
+            raise ReservationError('This reservation is not waiting to be seated')
+        reservation = Reservation.objects.select_related('table').get(id=reservation_id)
+        table = reservation.table
+        if not Table.objects.filter(id=table.id, status__in=['available', 'reserved']).update(status='occupied'):
+            raise ReservationError(f'Table {table.number} is still {table.get_status_display().lower()}')
+
+        order = Order(table=table, customer_name=reservation.customer_name, notes=reservation.notes, created_by=user)
+        order.save()
+        Reservation.objects.filter(id=reservation_id).update(order=order)
+        record_event('order_created', order_id=order.id, table_id=table.id,
+                     order_number=order.order_number, created_by=user.username if user else '',
+                     reservation_id=reservation_id)
+        record_event('table_status_changed', table_id=table.id, order_id=order.id, status='occupied')
+
+    invalidate('tables')
+    return order
+
+
+def _due(now):
+    """Booked reservations whose table should be held now"""
+    return Reservation.objects.filter(status='booked', start__lte=now + hold_time(), start__gte=now - grace_time())
+
+
+def _release_table(table_id, now=None):
+    now = now or timezone.now()
+    if _due(now).filter(table_id=table_id).exists():
+        return False
+    if Table.objects.filter(id=table_id, status='reserved').update(status='available'):
+        record_event('table_status_changed', table_id=table_id, status='available')
+        return True
+    return False
+
+
+def promote_due_reservations(now=None):
+    """Hold tables for upcoming bookings and release tables of no-shows.
+
+    Returns (tables reserved, tables released). Tables that are occupied
+    or being cleaned are left alone and picked up on a later run.
+    """
+    now = now or timezone.now()
+    reserved = released = 0
+
+    late = Reservation.objects.filter(status='booked', start__lt=now - grace_time())
+    for reservation_id, table_id in late.values_list('id', 'table_id'):
+        if Reservation.objects.filter(id=reservation_id, status='booked').update(status='no_show'):
+            released += _release_table(table_id, now)
+
+    for reservation_id, table_id in _due(now).values_list('id', 'table_id'):
+        if Table.objects.filter(id=table_id, status='available').update(status='reserved'):
+            record_event('table_status_changed', table_id=table_id, status='reserved',
+                         reservation_id=reservation_id)
+            reserved += 1
+
+    if reserved or released:
+        invalidate('tables')
+    return reserved, released
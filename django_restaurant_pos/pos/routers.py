@@ -0,0 +1,42 @@
+from .locations import SHARED_DB, location_db, shared_menu
+
+
+class LocationRouter:
+    """Send per-restaurant data to the current location's database.
+
+    Orders, order items, payments, tables, reservations, stock, the order
+    event log, stored sync results and day closes always follow the location.
+    Menu models follow it too unless the menu is shared, in which case they
+    are read and written in the shared database and mirrored out.
+    """
+    location_models = {
+        'order', 'orderitem', 'payment', 'table', 'orderevent', 'dailysalesrollup', 'stockshard', 'reservation',
+        'syncoperation', 'dayclose',
+    }
+    menu_models = {'category', 'menuitem'}
+
+    def _db(self, model):
+        if model._meta.app_label != 'pos':
+            return None
+        name = model._meta.model_name
+        if name in self.location_models:
+            return location_db()
+        if name in self.menu_models:
+            return SHARED_DB if shared_menu() else location_db()
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db(model)
+
+    def db_for_write(self, model, **hints):
+        return self._db(model)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Shared rows exist in every location database, so relations to them
+        # from location data are valid whichever database they were read from
+        if obj1._meta.app_label == 'auth' or obj2._meta.app_label == 'auth':
+            return True
+        names = {obj1._meta.model_name, obj2._meta.model_name}
+        if shared_menu() and names & self.menu_models:
+            return True
+        return None
@@ -0,0 +1,138 @@
+"""Batched, idempotent operations from terminals that may be offline.
+
+Terminals queue operations in the browser and send them to ``/api/sync/``
+in batches. Each operation carries a key generated by the terminal. The
+first time a key arrives, the operation is applied and its result stored
+in a SyncOperation row in the same transaction; a resend of the key gets
+the stored result back and changes nothing. So staff tapping twice, or a
+batch resent after a dropped connection, never adds an item twice.
+
+Results are kept for ``SYNC_KEY_HOURS``, which bounds how long a terminal
+may stay offline with queued operations.
+"""
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, router, transaction
+from django.utils import timezone
+
+from . import metrics
+from .inventory import OutOfStock
+from .models import MenuItem, Order, SyncOperation
+from .orders import OrderError, add_item, change_status
+
+MAX_BATCH = 200
+MAX_KEY_LENGTH = 100
+
+
+class SyncError(Exception):
+    """Raised when an operation can never be applied as sent"""
+
+
+def key_hash(key):
+    """Signed 64-bit hash of an idempotency key"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+def key_ttl():
+    return timedelta(hours=settings.POS_SETTINGS.get('SYNC_KEY_HOURS', 72))
+
+
+def _get_order(operation):
+    order = Order.objects.filter(id=operation.get('order_id')).first()
+    if order is None:
+        raise SyncError('Order not found')
+    return order
+
+
+def _add_item(operation):
+    order = _get_order(operation)
+    if order.status in Order.CLOSED_STATUSES:
+        raise SyncError(f'Order is {order.get_status_display()}, item not added')
+    menu_item = MenuItem.objects.filter(id=operation.get('menu_item_id')).first()
+    if menu_item is None:
+        raise SyncError('Menu item not found')
+    quantity = int(operation.get('quantity', 1))
+    add_item(order, menu_item, quantity, operation.get('special_instructions', ''))
+    metrics.items_added.inc(quantity)
+    return order.id
+
+
+def _update_status(operation):
+    order = _get_order(operation)
+    old_status, new_status = order.status, operation.get('status')
+    # A change made offline must not undo what another terminal did meanwhile
+    expected = operation.get('expected_status')
+    if expected and expected != old_status:
+        raise SyncError(f'Order is now {order.get_status_display()}, not changed')
+    change_status(order, new_status)
+    metrics.order_status_changes.inc(status=new_status)
+    if new_status == 'served' and old_status != 'served':
+        metrics.pending_to_served.observe((timezone.now() - order.created_at).total_seconds())
+    return order.id
+
+
+OPERATIONS = {
+    'add_item': _add_item,
+    'update_status': _update_status,
+}
+
+
+def apply_operation(operation):
+    """Apply one operation unless its key was seen before; returns its result.
+
+    Rejected operations (unknown order, out of stock...) are stored too, so
+    a resend is rejected the same way. Database errors are not stored and
+    the result asks the terminal to retry.
+    """
+    if not isinstance(operation, dict):
+        return {'success': False, 'error': 'Operation must be an object'}
+    key, name = operation.get('key'), operation.get('op')
+    if not isinstance(key, str) or not key or len(key) > MAX_KEY_LENGTH:
+        return {'success': False, 'error': f'Operation needs a key of at most {MAX_KEY_LENGTH} characters'}
+    handler = OPERATIONS.get(name)
+    if handler is None:
+        return {'success': False, 'error': f'Unknown operation "{name}"'}
+
+    hashed = key_hash(key)
+    using = router.db_for_write(SyncOperation)
+    try:
+        with transaction.atomic(using=using):
+            # Claiming the key is the first write, so a concurrent resend of
+            # the same key waits here and then finds the stored result
+            try:
+                with transaction.atomic(using=using):
+                    record = SyncOperation.objects.create(key_hash=hashed)
+            except IntegrityError:
+                stored = SyncOperation.objects.filter(key_hash=hashed).values_list('response', flat=True).first()
+                metrics.sync_operations.inc(op=name, outcome='replayed')
+                return dict(stored or {}, replayed=True)
+
+            try:
+                with transaction.atomic(using=using):
+                    result = {'success': True, 'order_id': handler(operation)}
+            except (SyncError, OrderError, OutOfStock, ValueError, TypeError) as e:
+                result = {'success': False, 'error': str(e)}
+            SyncOperation.objects.filter(id=record.id).update(response=result)
+    except DatabaseError as e:
+        metrics.sync_operations.inc(op=name, outcome='retry')
+        return {'success': False, 'error': str(e), 'retry': True}
+
+    metrics.sync_operations.inc(op=name, outcome='applied' if result['success'] else 'rejected')
+    return result
+
+
+def apply_batch(operations):
+    """Apply operations in the order they were queued, each in its own transaction"""
+    return [
+        dict(apply_operation(operation), key=operation.get('key') if isinstance(operation, dict) else None)
+        for operation in operations
+    ]
+
+
+def prune(older_than=None):
+    """Forget stored results older than the resend window"""
+    cutoff = timezone.now() - (older_than or key_ttl())
+    deleted, _ = SyncOperation.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,259 @@
+"""Background tasks backed by the Task table.
+
+Register a function with ``@task`` and queue it with ``enqueue``; the
+``run_worker`` command claims queued rows and runs them on a thread pool.
+No broker is needed, the database is the queue. Tasks registered with
+``every=seconds`` are queued by the workers on that schedule, once per
+location.
+
+A dedupe key allows one queued copy of a task. A copy queued while another
+runs waits for it to finish, so work that reads then writes (like the
+rollups) never runs twice at once, and nothing enqueued mid-run is lost.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Min
+from django.utils import timezone
+
+from .events import flush_events, update_rollups
+from .locations import get_current_location, get_locations, sync_shared_rows, use_location
+from .models import Task
+from .reservations import promote_due_reservations
+from .sync import prune as prune_sync_operations
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class TaskStats:
+    """In-process counters for tasks run by this worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {'succeeded': 0, 'retried': 0, 'failed': 0}
+        self.total_seconds = 0.0
+
+    def record(self, outcome, seconds):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.total_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts, seconds=round(self.total_seconds, 3))
+
+
+stats = TaskStats()
+
+
+def task(name=None, priority=0, max_attempts=3, every=None):
+    """Register a function as a background task, run every ``every`` seconds if given"""
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.task_options = {'priority': priority, 'max_attempts': max_attempts, 'every': every}
+        _registry[func.task_name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    return _registry[name]
+
+
+def enqueue(func_or_name, *args, dedupe_key='', priority=None, delay=None, **kwargs):
+    """Queue a task and return its Task row.
+
+    When ``dedupe_key`` matches a task that is still queued, no new row is
+    added and the queued task is returned instead. A running task does not
+    count: it may already have read the data this enqueue is about.
+    """
+    func = _registry[func_or_name] if isinstance(func_or_name, str) else func_or_name
+    options = func.task_options
+    try:
+        with transaction.atomic():
+            return Task.objects.create(
+                name=func.task_name,
+                args=list(args),
+                kwargs=kwargs,
+                location=get_current_location(),
+                priority=options['priority'] if priority is None else priority,
+                max_attempts=options['max_attempts'],
+                dedupe_key=dedupe_key,
+                run_after=timezone.now() + (delay or timedelta()),
+            )
+    except IntegrityError:
+        existing = Task.objects.filter(dedupe_key=dedupe_key, status='queued').first()
+        if existing is None:
+            raise
+        return existing
+
+
+def queue_rollup_update():
+    """Queue a rollup update for the current location, after its events are written.
+
+    Events sit in the buffer until the request ends, so write them first or
+    the worker could roll up before they exist. Call it from on_commit so
+    it runs right after the buffer takes the transaction's events.
+    """
+    flush_events()
+    return enqueue(update_rollups_task, dedupe_key=f'{update_rollups_task.task_name}:{get_current_location()}')
+
+
+def schedule_periodic(last_queued, now=None):
+    """Queue periodic tasks that are due, for every location.
+
+    ``last_queued`` maps task names to when this worker last queued them and
+    is updated in place. The dedupe key stops several workers from piling up
+    copies of the same task.
+    """
+    now = now or time.monotonic()
+    queued = []
+    for name, func in _registry.items():
+        every = func.task_options.get('every')
+        if not every or now - last_queued.get(name, float('-inf')) < every:
+            continue
+        last_queued[name] = now
+        for code in get_locations():
+            with use_location(code):
+                enqueue(func, dedupe_key=f'{name}:{code}')
+        queued.append(name)
+    return queued
+
+
+def claim_tasks(worker, limit=1):
+    """Atomically mark up to ``limit`` due tasks as running for this worker"""
+    now = timezone.now()
+    # A copy of a task that is still running waits for it to finish
+    running_keys = Task.objects.filter(status='running').exclude(dedupe_key='').values('dedupe_key')
+    candidates = (
+        Task.objects.filter(status='queued', run_after__lte=now)
+        .exclude(dedupe_key__in=running_keys)
+        .order_by('-priority', 'run_after', 'id')
+        .values_list('id', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for task_id in candidates:
+        # Conditional UPDATE so two workers can never claim the same row
+        if Task.objects.filter(id=task_id, status='queued').update(
+            status='running', worker=worker, started_at=now, attempts=F('attempts') + 1,
+        ):
+            claimed.append(task_id)
+            if len(claimed) >= limit:
+                break
+    return list(Task.objects.filter(id__in=claimed).order_by('-priority', 'id'))
+
+
+def requeue(task_id, **fields):
+    """Put a task back in the queue; returns False if a queued copy makes it redundant"""
+    try:
+        with transaction.atomic():
+            return bool(Task.objects.filter(id=task_id).update(status='queued', **fields))
+    except IntegrityError:
+        # The queued copy will do the same work
+        Task.objects.filter(id=task_id).update(
+            status='failed', finished_at=timezone.now(),
+            last_error=fields.get('last_error') or 'Superseded by a queued copy',
+        )
+        return False
+
+
+def retry_delay(attempts):
+    """Exponential backoff: 10s, 20s, 40s... capped at 10 minutes"""
+    return timedelta(seconds=min(10 * 2 ** (attempts - 1), 600))
+
+
+def run_task(task_row):
+    """Run one claimed task and record its outcome"""
+    started = time.perf_counter()
+    try:
+        func = get_task(task_row.name)
+        with use_location(task_row.location or get_current_location()):
+            func(*task_row.args, **task_row.kwargs)
+    except Exception as e:
+        logger.exception('Task %s (%s) failed', task_row.id, task_row.name)
+        if task_row.attempts < task_row.max_attempts and task_row.name in _registry and requeue(
+            task_row.id, last_error=repr(e), run_after=timezone.now() + retry_delay(task_row.attempts),
+        ):
+            stats.record('retried', time.perf_counter() - started)
+        else:
+            Task.objects.filter(id=task_row.id).update(
+                status='failed', last_error=repr(e), finished_at=timezone.now(),
+            )
+            stats.record('failed', time.perf_counter() - started)
+        return False
+    else:
+        Task.objects.filter(id=task_row.id).update(status='done', last_error='', finished_at=timezone.now())
+        stats.record('succeeded', time.perf_counter() - started)
+        return True
+    finally:
+        flush_events()
+
+
+def requeue_stale(timeout=timedelta(minutes=15)):
+    """Put back tasks whose worker died while running them"""
+    stale = Task.objects.filter(
+        status='running', started_at__lt=timezone.now() - timeout,
+    ).values_list('id', flat=True)
+    return sum(requeue(task_id, worker='') for task_id in list(stale))
+
+
+def purge_finished(older_than=timedelta(days=7)):
+    """Delete finished tasks to keep the queue table small"""
+    deleted, _ = Task.objects.filter(
+        status__in=['done', 'failed'], finished_at__lt=timezone.now() - older_than,
+    ).delete()
+    return deleted
+
+
+def queue_metrics():
+    """Queue depth, oldest waiting task, failures and recent run times"""
+    now = timezone.now()
+    by_status = dict(Task.objects.values_list('status').annotate(count=Count('id')).order_by())
+    oldest = Task.objects.filter(status='queued', run_after__lte=now).aggregate(oldest=Min('run_after'))['oldest']
+    recent = Task.objects.filter(status='done', finished_at__gte=now - timedelta(hours=1)).aggregate(
+        count=Count('id'),
+        avg_seconds=Avg(F('finished_at') - F('started_at')),
+    )
+    avg = recent['avg_seconds']
+    return {
+        'queued': by_status.get('queued', 0),
+        'running': by_status.get('running', 0),
+        'done': by_status.get('done', 0),
+        'failed': by_status.get('failed', 0),
+        'oldest_queued_seconds': (now - oldest).total_seconds() if oldest else 0,
+        'done_last_hour': recent['count'],
+        'avg_run_seconds_last_hour': avg.total_seconds() if avg else 0,
+        'worker': stats.snapshot(),
+    }
+
+
+# Built-in tasks
+
+@task(name='pos.update_rollups', priority=-1)
+def update_rollups_task(rebuild=False):
+    update_rollups(rebuild=rebuild)
+
+
+@task(name='pos.sync_shared_rows', priority=5)
+def sync_shared_rows_task():
+    sync_shared_rows()
+
+
+@task(name='pos.promote_reservations', priority=3, every=60)
+def promote_reservations_task():
+    promote_due_reservations()
+
+
+@task(name='pos.purge_finished_tasks', priority=-5)
+def purge_finished_task(days=7):
+    purge_finished(timedelta(days=days))
+
+
+@task(name='pos.prune_sync_operations', priority=-5, every=3600)
+def prune_sync_operations_task():
+    prune_sync_operations()
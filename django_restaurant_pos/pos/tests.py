@@ -0,0 +1,188 @@
+"""Tests for the POS app.
+
+Query budgets cover every POS page and admin changelist, and the write
+endpoints on the ordering and payment paths. Each request runs with cold
+caches and must answer without a server error, within its query budget
+and a generous time limit; pages must also run no more queries once there
+is ten times as much data (the usual sign of a related object loaded per
+row). ``manage.py check_query_budget`` runs the same requests at larger
+sizes with a tighter time limit.
+"""
+import tempfile
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from pos.checkout import checkout
+from pos.events import flush_events, update_rollups
+from pos.inventory import set_stock, stock_levels
+from pos.management.benchmark import (
+    BUDGETS, DEFAULT_BUDGET, WRITE_BUDGETS, budget_objects, budget_posts, budget_urls, seed_budget_data,
+)
+from pos.menu_io import export_menu, import_menu
+from pos.models import Category, MenuItem, Order, Payment, Reservation
+from pos.orders import OrderError, add_item, change_status
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-shared'},
+}
+
+
+class QueryBudgetTests(TestCase):
+    scale = 20
+    # Only catches a request gone badly wrong; check_query_budget times them properly
+    max_seconds = 2
+
+    @classmethod
+    def setUpClass(cls):
+        # Keep cache and metric writes away from the real ones
+        metrics_dir = tempfile.TemporaryDirectory(prefix='pos-test-')
+        cls.addClassCleanup(metrics_dir.cleanup)
+        test_settings = override_settings(
+            CACHES=TEST_CACHES,
+            POS_SETTINGS=dict(settings.POS_SETTINGS, METRICS_DIR=metrics_dir.name),
+        )
+        test_settings.enable()
+        cls.addClassCleanup(test_settings.disable)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, orders, menu_items, tables = seed_budget_data(cls.scale)
+        flush_events()
+        cls.objects = budget_objects(orders, menu_items, tables)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def measure(self, path, data=None, content_type=None):
+        """(response, queries, seconds) for a GET of ``path``, or a POST of ``data``, with cold caches"""
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            if data is None:
+                response = self.client.get(path)
+            elif content_type:
+                response = self.client.post(path, data, content_type=content_type)
+            else:
+                response = self.client.post(path, data)
+            elapsed = time.perf_counter() - started
+        return response, [query['sql'] for query in captured.captured_queries], elapsed
+
+    def assertWithinBudget(self, name, queries, budget, elapsed):
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{name} ran {len(queries)} queries, budget {budget}:\n' + '\n'.join(queries),
+        )
+        self.assertLess(elapsed, self.max_seconds, f'{name} took {elapsed:.2f}s')
+
+    def test_pages_within_budget(self):
+        for name, path in budget_urls(self.objects):
+            with self.subTest(page=name):
+                response, queries, elapsed = self.measure(path)
+                self.assertLess(response.status_code, 500)
+                self.assertWithinBudget(name, queries, BUDGETS.get(name, DEFAULT_BUDGET), elapsed)
+
+    def test_writes_within_budget(self):
+        for name, path, data, content_type in budget_posts(self.objects):
+            with self.subTest(endpoint=name):
+                response, queries, elapsed = self.measure(path, data, content_type)
+                if response['Content-Type'] == 'application/json':
+                    body = response.json()
+                    self.assertTrue(body['success'], body)
+                    self.assertTrue(all(result['success'] for result in body.get('results', [])), body)
+                else:
+                    self.assertEqual(response.status_code, 302)
+                self.assertWithinBudget(name, queries, WRITE_BUDGETS[name], elapsed)
+
+        # Form posts redirect either way, so check they did their work
+        self.assertEqual(Order.objects.get(id=self.objects['open_order_id']).status, 'preparing')
+        self.assertTrue(Reservation.objects.filter(customer_name='Budget guest').exists())
+        self.assertTrue(Payment.objects.filter(order_id=self.objects['payable_order_id']).exists())
+
+    def test_queries_do_not_grow_with_data(self):
+        urls = budget_urls(self.objects)
+        # A first visit may queue work (the sales report queues a rollup), count a repeat visit
+        for name, path in urls:
+            self.measure(path)
+        before = {name: len(self.measure(path)[1]) for name, path in urls}
+
+        seed_budget_data(self.scale * 10, batch=1)
+        flush_events()
+        for name, path in urls:
+            with self.subTest(page=name):
+                queries = self.measure(path)[1]
+                self.assertLessEqual(
+                    len(queries), before[name],
+                    f'{name} grew from {before[name]} to {len(queries)} queries:\n' + '\n'.join(queries),
+                )
+
+
+class MenuImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        mains = Category.objects.create(name='Mains', description='Hot food')
+        old = Category.objects.create(name='Old', is_active=False)
+        Category.objects.create(name='Specials')
+        MenuItem.objects.create(category=mains, name='Burger', price='9.50')
+        MenuItem.objects.create(category=mains, name='Soup', price='4.00', is_available=False)
+        MenuItem.objects.create(category=old, name='Stew', price='7.25')
+
+    def test_export_import_round_trip_changes_nothing(self):
+        for fmt in ('csv', 'json'):
+            with self.subTest(fmt=fmt):
+                diff = import_menu(export_menu(fmt), fmt, dry_run=True)
+                self.assertFalse(diff.has_changes, diff.summary())
+
+    def test_import_applies_category_state(self):
+        content = export_menu('csv').replace('Mains,Hot food,true', 'Mains,Hot food,false')
+        content = content.replace('Old,,false', 'Old,,true')
+        import_menu(content, 'csv')
+        self.assertFalse(Category.objects.get(name='Mains').is_active)
+        self.assertTrue(Category.objects.get(name='Old').is_active)
+        # A category without items in the file is left alone
+        self.assertTrue(Category.objects.get(name='Specials').is_active)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('cashier')
+
+    def test_manual_paid_status_counts_like_checkout(self):
+        checked_out = Order.objects.create(order_number='ROLLUP1', created_by=self.user, total=Decimal('12.50'))
+        marked_paid = Order.objects.create(order_number='ROLLUP2', created_by=self.user, total=Decimal('7.50'))
+        with self.captureOnCommitCallbacks(execute=True):
+            checkout(checked_out.id, 'cash', '12.50', user=self.user)
+            change_status(marked_paid, 'paid')
+        flush_events()
+
+        rollup, = update_rollups(rebuild=True)
+        self.assertEqual(rollup.orders_paid, 2)
+        self.assertEqual(rollup.revenue, Decimal('20.00'))
+
+
+class OrderStatusTests(TestCase):
+    def test_paid_order_cannot_be_cancelled(self):
+        user = User.objects.create_user('waiter')
+        category = Category.objects.create(name='Mains')
+        item = MenuItem.objects.create(category=category, name='Burger', price='9.50')
+        set_stock(item.id, 5)
+        order = Order.objects.create(order_number='PAID1', created_by=user)
+        add_item(order, item, 2)
+        checkout(order.id, 'cash', order.total, user=user)
+        order.refresh_from_db()
+
+        with self.assertRaises(OrderError):
+            change_status(order, 'cancelled')
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'paid')
+        # The sold portions stay sold
+        self.assertEqual(stock_levels([item.id])[item.id], 3)
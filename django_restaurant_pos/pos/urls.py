@@ -23,6 +23,9 @@ urlpatterns = [
     path('menu/edit/<int:item_id>/', views.edit_menu_item, name='edit_menu_item'),
     path('menu/delete/<int:item_id>/', views.delete_menu_item, name='delete_menu_item'),
     path('menu/toggle/<int:item_id>/', views.toggle_menu_item, name='toggle_menu_item'),
+    path('menu/stock/<int:item_id>/', views.update_stock, name='update_stock'),
+    path('menu/import/', views.menu_import, name='menu_import'),
+    path('menu/export/', views.menu_export, name='menu_export'),
     
     # Category Management
     path('categories/', views.manage_categories, name='manage_categories'),
@@ -39,13 +42,37 @@ urlpatterns = [
     path('tables/', views.table_management, name='table_management'),
     path('tables/<int:table_id>/status/', views.update_table_status, name='update_table_status'),
     
+    # Reservations
+    path('reservations/', views.reservation_list, name='reservation_list'),
+    path('reservations/book/', views.book_reservation, name='book_reservation'),
+    path('reservations/<int:reservation_id>/status/', views.update_reservation, name='update_reservation'),
+    
     # Billing and Payment
     path('billing/<int:order_id>/', views.billing, name='billing'),
     path('payment/<int:order_id>/', views.process_payment, name='process_payment'),
     path('receipt/<int:order_id>/', views.print_receipt, name='print_receipt'),
     
+    # Locations
+    path('locations/select/', views.select_location, name='select_location'),
+    path('locations/report/', views.location_report, name='location_report'),
+    
+    # Reports
+    path('reports/sales/', views.sales_report, name='sales_report'),
+    path('reports/close/', views.day_close, name='day_close'),
+    path('reports/close/print/', views.print_z_report, name='print_z_report'),
+    
+    # Monitoring
+    path('metrics/', views.metrics_view, name='metrics'),
+    
     # AJAX endpoints
     path('api/menu-items/', views.get_menu_items, name='api_menu_items'),
     path('api/add-to-order/', views.add_item_to_order, name='api_add_to_order'),
     path('api/order-totals/<int:order_id>/', views.get_order_totals, name='api_order_totals'),
+    path('api/orders/<int:order_id>/state/', views.get_order_state, name='api_order_state'),
+    path('api/sync/', views.sync_operations, name='api_sync'),
+    path('api/tables/suggest/', views.suggest_tables, name='api_suggest_tables'),
+    path('api/reservations/availability/', views.get_table_availability, name='api_table_availability'),
+    path('api/events/', views.get_order_events, name='api_order_events'),
+    path('api/tasks/metrics/', views.get_task_metrics, name='api_task_metrics'),
+    path('api/cache/metrics/', views.get_cache_metrics, name='api_cache_metrics'),
 ]
\ No newline at end of file
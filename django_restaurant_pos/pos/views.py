@@ -1,21 +1,66 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.utils import timezone
-from django.db.models import Sum, Count
-from decimal import Decimal
+from django.utils.dateparse import parse_date
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.db import router, transaction
+from django.db.models import Sum, Count, Prefetch
+from datetime import datetime, time, timedelta
+from decimal import InvalidOperation
+import hashlib
+import hmac
 import json
 
-from .models import MenuItem, Category, Order, OrderItem, Table, Payment
-from .forms import MenuItemForm, CategoryForm, OrderForm
-
-
-@login_required
-def dashboard(request):
-    """Dashboard with overview of today's activity"""
+from asgiref.sync import sync_to_async
+
+from .models import MenuItem, Category, Order, OrderItem, Table, Payment, DailySalesRollup, Reservation, DayClose
+from . import async_support, metrics
+from .async_support import aget_object_or_404
+from .allocation import AllocationError, allocate, claim_table, set_table_status, suggest
+from .cache import aget_or_compute, cache_metrics, generation, get_or_compute, invalidate
+from .checkout import CheckoutError, checkout
+from .closing import CloseError, close_day, day_report
+from .events import record_event, stream
+from .forms import MenuItemForm, CategoryForm, OrderForm, MenuImportForm, ReservationForm, ReservationSearchForm
+from .reporting import sales_by_location
+from .tasks import queue_metrics, queue_rollup_update
+from .locations import LOCATION_COOKIE, get_locations
+from .inventory import OutOfStock, set_stock, sold_out_ids, stock_levels
+from .orders import OrderError, add_item, change_status
+from .reservations import ReservationError, available_tables, book, cancel, seat
+from .sync import MAX_BATCH, apply_batch
+from .menu_io import MenuImportError, detect_format, export_menu, import_menu
+
+
+def get_active_menu():
+    """Active categories and available menu items, cached until the menu changes"""
+    categories, menu_items = get_or_compute('active_menu', lambda: (
+        list(Category.objects.filter(is_active=True)),
+        list(MenuItem.objects.filter(is_available=True).select_related('category')),
+    ), groups=('menu',))
+    # The menu may be shared; what has sold out depends on this location's stock
+    sold_out = sold_out_ids()
+    return categories, [item for item in menu_items if item.id not in sold_out]
+
+
+def get_tables():
+    """All tables by number, cached until a table changes"""
+    return get_or_compute(
+        'tables',
+        lambda: list(Table.objects.select_related('joined_to').order_by('number')),
+        groups=('tables',)
+    )
+
+
+def get_dashboard_stats():
+    """Today's figures for the dashboard, cached for a few seconds"""
     today = timezone.now().date()
     
     # Today's statistics
@@ -24,7 +69,7 @@ def dashboard(request):
     total_sales = todays_orders.aggregate(Sum('total'))['total__sum'] or 0
     
     # Recent orders
-    recent_orders = Order.objects.order_by('-created_at')[:10]
+    recent_orders = Order.objects.select_related('table').order_by('-created_at')[:10]
     
     # Top selling items today
     top_items = OrderItem.objects.filter(
@@ -35,16 +80,96 @@ def dashboard(request):
         total_quantity=Sum('quantity')
     ).order_by('-total_quantity')[:5]
     
-    # Table status
-    tables = Table.objects.all().order_by('number')
-    
-    context = {
+    return {
         'total_orders': total_orders,
         'total_sales': total_sales,
-        'recent_orders': recent_orders,
-        'top_items': top_items,
-        'tables': tables,
+        'recent_orders': list(recent_orders),
+        'top_items': list(top_items),
+    }
+
+
+def get_order_version(request, order_id):
+    """An order's updated_at, looked up once per request"""
+    versions = request.__dict__.setdefault('_order_versions', {})
+    if order_id not in versions:
+        versions[order_id] = Order.objects.filter(id=order_id).values_list('updated_at', flat=True).first()
+    return versions[order_id]
+
+
+def order_etag(request, order_id, **kwargs):
+    # Pages carrying flash messages must always render, or the message is lost
+    updated_at = get_order_version(request, order_id)
+    if updated_at is None or len(messages.get_messages(request)):
+        return None
+    # Pages also show the menu and embed the CSRF token, which a new login rotates
+    csrf = hashlib.blake2b((request.META.get('CSRF_COOKIE') or '').encode(), digest_size=6).hexdigest()
+    return (f'"order-{order_id}-{int(updated_at.timestamp() * 1000000)}-{request.user.pk}'
+            f'-m{generation("menu")}s{generation("stock")}-{csrf}"')
+
+
+def order_last_modified(request, order_id, **kwargs):
+    if len(messages.get_messages(request)):
+        return None
+    return get_order_version(request, order_id)
+
+
+def order_conditional(view_func):
+    """Answer repeat GETs of an unchanged order with 304 Not Modified"""
+    view_func = condition(etag_func=order_etag, last_modified_func=order_last_modified)(view_func)
+    return cache_control(private=True, no_cache=True)(view_func)
+
+
+def async_order_conditional(view_func):
+    """order_conditional for async views"""
+    return async_support.condition(
+        etag_func=order_etag, last_modified_func=order_last_modified, private=True, no_cache=True,
+    )(view_func)
+
+
+def build_order_state(order_id):
+    """Status, totals and items of an order, read with a single joined query"""
+    rows = list(Order.objects.filter(id=order_id).values(
+        'id', 'order_number', 'status', 'subtotal', 'tax_amount', 'total', 'updated_at',
+        'orderitem__id', 'orderitem__menu_item_id', 'orderitem__menu_item__name',
+        'orderitem__quantity', 'orderitem__unit_price', 'orderitem__special_instructions',
+    ).order_by('orderitem__id'))
+    if not rows:
+        return None
+    
+    order = rows[0]
+    return {
+        'id': order['id'],
+        'order_number': order['order_number'],
+        'status': order['status'],
+        'status_display': dict(Order.ORDER_STATUSES)[order['status']],
+        'subtotal': order['subtotal'],
+        'tax': order['tax_amount'],
+        'total': order['total'],
+        'version': order['updated_at'],
+        'items': [
+            {
+                'id': row['orderitem__id'],
+                'menu_item_id': row['orderitem__menu_item_id'],
+                'name': row['orderitem__menu_item__name'],
+                'quantity': row['orderitem__quantity'],
+                'unit_price': row['orderitem__unit_price'],
+                'total': row['orderitem__quantity'] * row['orderitem__unit_price'],
+                'special_instructions': row['orderitem__special_instructions'],
+            }
+            for row in rows if row['orderitem__id'] is not None
+        ],
     }
+
+
+def order_state_response(state, **extra):
+    """Compact JSON; Decimals are sent as exact strings, never floats"""
+    return JsonResponse(dict(extra, order=state), json_dumps_params={'separators': (',', ':')})
+
+
+@login_required
+def dashboard(request):
+    """Dashboard with overview of today's activity"""
+    context = dict(get_or_compute('dashboard', get_dashboard_stats), tables=get_tables())
     
     return render(request, 'pos/dashboard.html', context)
 
@@ -53,7 +178,12 @@ def dashboard(request):
 def menu_management(request):
     """Menu management page"""
     categories = Category.objects.filter(is_active=True)
-    menu_items = MenuItem.objects.select_related('category').all()
+    menu_items = list(MenuItem.objects.select_related('category').all())
+    
+    # Portions left for stock-tracked items
+    stock = stock_levels()
+    for item in menu_items:
+        item.stock = stock.get(item.id)
     
     context = {
         'categories': categories,
@@ -128,6 +258,61 @@ def toggle_menu_item(request, item_id):
     return redirect('pos:menu_management')
 
 
+@staff_member_required
+def menu_import(request):
+    """Bulk import menu items from a CSV or JSON file"""
+    diff = None
+    
+    if request.method == 'POST':
+        form = MenuImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            dry_run = form.cleaned_data['dry_run']
+            try:
+                content = upload.read().decode('utf-8-sig')
+                diff = import_menu(content, detect_format(upload.name), dry_run=dry_run)
+            except (UnicodeDecodeError, MenuImportError) as e:
+                form.add_error('file', str(e))
+            else:
+                if not dry_run:
+                    messages.success(request, 'Menu imported successfully!')
+                    return redirect('pos:menu_management')
+    else:
+        form = MenuImportForm()
+    
+    return render(request, 'pos/menu_import.html', {'form': form, 'diff': diff})
+
+
+@staff_member_required
+def menu_export(request):
+    """Download the menu in the import format"""
+    fmt = 'json' if request.GET.get('format') == 'json' else 'csv'
+    content_type = 'application/json' if fmt == 'json' else 'text/csv'
+    
+    response = HttpResponse(export_menu(fmt), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="menu.{fmt}"'
+    return response
+
+
+@staff_member_required
+def update_stock(request, item_id):
+    """Set portions in stock for a menu item; blank stops tracking"""
+    item = get_object_or_404(MenuItem, id=item_id)
+    
+    if request.method == 'POST':
+        quantity = request.POST.get('quantity', '').strip()
+        if quantity and not quantity.isdigit():
+            messages.error(request, 'Stock must be a whole number.')
+        else:
+            set_stock(item.id, int(quantity) if quantity else None)
+            if quantity:
+                messages.success(request, f'{item.name} stock set to {quantity}!')
+            else:
+                messages.success(request, f'{item.name} is no longer stock-tracked.')
+    
+    return redirect('pos:menu_management')
+
+
 @staff_member_required
 def manage_categories(request):
     """Manage categories"""
@@ -168,7 +353,13 @@ def add_category(request):
 @login_required
 def order_list(request):
     """List all orders"""
-    orders = Order.objects.select_related('table', 'created_by').order_by('-created_at')
+    # Items and their count come from two queries, however many orders are listed
+    orders = (
+        Order.objects.select_related('table', 'created_by')
+        .prefetch_related(Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('menu_item')))
+        .annotate(item_count=Count('orderitem'))
+        .order_by('-created_at')
+    )
     
     context = {
         'orders': orders,
@@ -185,26 +376,35 @@ def new_order(request):
         if form.is_valid():
             order = form.save(commit=False)
             order.created_by = request.user
-            order.save()
-            
-            # Update table status if table is selected
-            if order.table:
-                order.table.status = 'occupied'
-                order.table.save()
-            
-            messages.success(request, f'Order {order.order_number} created successfully!')
-            return redirect('pos:order_detail', order_id=order.id)
+            party_size = form.cleaned_data.get('party_size')
+            try:
+                with transaction.atomic(using=router.db_for_write(Order)):
+                    # Claim the table with a conditional UPDATE so two hosts can't seat it twice
+                    allocation = None
+                    if order.table:
+                        allocation = claim_table(order.table)
+                    elif party_size:
+                        allocation = allocate(party_size)
+                        order.table_id = allocation.table_ids[0]
+                    order.save()
+                    record_event('order_created', order_id=order.id, table_id=order.table_id,
+                                 order_number=order.order_number, created_by=request.user.username)
+                    for table_id in allocation.table_ids if allocation else []:
+                        record_event('table_status_changed', table_id=table_id, order_id=order.id, status='occupied')
+            except AllocationError as e:
+                messages.error(request, str(e))
+            else:
+                metrics.orders_created.inc()
+                seated = f' at {allocation.label()}' if allocation else ''
+                messages.success(request, f'Order {order.order_number} created successfully{seated}!')
+                return redirect('pos:order_detail', order_id=order.id)
     else:
         form = OrderForm()
     
-    # Get available tables
-    available_tables = Table.objects.filter(status='available')
-    categories = Category.objects.filter(is_active=True)
-    menu_items = MenuItem.objects.filter(is_available=True).select_related('category')
+    categories, menu_items = get_active_menu()
     
     context = {
         'form': form,
-        'available_tables': available_tables,
         'categories': categories,
         'menu_items': menu_items,
     }
@@ -213,12 +413,12 @@ def new_order(request):
 
 
 @login_required
+@order_conditional
 def order_detail(request, order_id):
     """Order detail and editing"""
     order = get_object_or_404(Order, id=order_id)
     order_items = order.orderitem_set.select_related('menu_item').all()
-    categories = Category.objects.filter(is_active=True)
-    menu_items = MenuItem.objects.filter(is_available=True).select_related('category')
+    categories, menu_items = get_active_menu()
     
     context = {
         'order': order,
@@ -236,11 +436,36 @@ def edit_order(request, order_id):
     order = get_object_or_404(Order, id=order_id)
     
     if request.method == 'POST':
+        old_table_id = order.table_id
         form = OrderForm(request.POST, instance=order)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Order updated successfully!')
-            return redirect('pos:order_detail', order_id=order.id)
+            order = form.save(commit=False)
+            party_size = form.cleaned_data.get('party_size')
+            # Closed orders have already given their table back
+            seating = order.status not in Order.CLOSED_STATUSES
+            try:
+                with transaction.atomic(using=router.db_for_write(Order)):
+                    # Moving tables goes through the same claim as a new order
+                    allocation = None
+                    if seating and order.table_id != old_table_id:
+                        if order.table:
+                            allocation = claim_table(order.table)
+                        elif party_size:
+                            allocation = allocate(party_size)
+                            order.table_id = allocation.table_ids[0]
+                    order.save()
+                    for table_id in allocation.table_ids if allocation else []:
+                        record_event('table_status_changed', table_id=table_id, order_id=order.id, status='occupied')
+                    if seating and old_table_id and order.table_id != old_table_id:
+                        set_table_status(old_table_id, 'available')
+                        record_event('table_status_changed', table_id=old_table_id, order_id=order.id,
+                                     status='available')
+                        transaction.on_commit(lambda: invalidate('tables'), using=router.db_for_write(Table))
+            except AllocationError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, 'Order updated successfully!')
+                return redirect('pos:order_detail', order_id=order.id)
     else:
         form = OrderForm(instance=order)
     
@@ -251,21 +476,23 @@ def edit_order(request, order_id):
     })
 
 
-@login_required
-def update_order_status(request, order_id):
+@async_support.login_required
+async def update_order_status(request, order_id):
     """Update order status"""
     if request.method == 'POST':
-        order = get_object_or_404(Order, id=order_id)
+        order = await aget_object_or_404(Order, id=order_id)
         new_status = request.POST.get('status')
         
         if new_status in dict(Order.ORDER_STATUSES):
-            order.status = new_status
-            order.save()
+            old_status = order.status
+            try:
+                await sync_to_async(change_status)(order, new_status)
+            except (OrderError, OutOfStock) as e:
+                return JsonResponse({'success': False, 'error': str(e)})
             
-            # Free table if order is completed or cancelled
-            if new_status in ['paid', 'cancelled'] and order.table:
-                order.table.status = 'available'
-                order.table.save()
+            metrics.order_status_changes.inc(status=new_status)
+            if new_status == 'served' and old_status != 'served':
+                metrics.pending_to_served.observe((timezone.now() - order.created_at).total_seconds())
             
             return JsonResponse({'success': True, 'status': new_status})
     
@@ -275,7 +502,7 @@ def update_order_status(request, order_id):
 @login_required
 def table_management(request):
     """Table management interface"""
-    tables = Table.objects.all().order_by('number')
+    tables = get_tables()
     
     context = {
         'tables': tables,
@@ -284,16 +511,22 @@ def table_management(request):
     return render(request, 'pos/table_management.html', context)
 
 
-@login_required
-def update_table_status(request, table_id):
+@async_support.login_required
+async def update_table_status(request, table_id):
     """Update table status"""
     if request.method == 'POST':
-        table = get_object_or_404(Table, id=table_id)
+        table = await aget_object_or_404(Table, id=table_id)
         new_status = request.POST.get('status')
         
         if new_status in dict(Table.TABLE_STATUSES):
-            table.status = new_status
-            table.save()
+            def apply():
+                # Tables joined to this one follow it
+                set_table_status(table.id, new_status)
+                invalidate('tables')
+                record_event('table_status_changed', table_id=table.id, status=new_status)
+            
+            await sync_to_async(apply)()
+            metrics.table_status_changes.inc(status=new_status)
             
             return JsonResponse({'success': True, 'status': new_status})
     
@@ -301,6 +534,7 @@ def update_table_status(request, table_id):
 
 
 @login_required
+@order_conditional
 def billing(request, order_id):
     """Billing interface for an order"""
     order = get_object_or_404(Order, id=order_id)
@@ -320,41 +554,67 @@ def billing(request, order_id):
 @login_required
 def process_payment(request, order_id):
     """Process payment for an order"""
-    order = get_object_or_404(Order, id=order_id)
-    
     if request.method == 'POST':
-        payment_method = request.POST.get('payment_method')
-        amount = Decimal(request.POST.get('amount', '0'))
-        reference_number = request.POST.get('reference_number', '')
-        
-        if amount >= order.total:
-            # Create payment record
-            payment = Payment.objects.create(
-                order=order,
-                amount=amount,
-                method=payment_method,
-                reference_number=reference_number,
-                processed_by=request.user
-            )
-            
-            # Update order status
-            order.status = 'paid'
-            order.save()
-            
-            # Free table
-            if order.table:
-                order.table.status = 'available'
-                order.table.save()
-            
-            messages.success(request, f'Payment processed successfully for order {order.order_number}!')
-            return redirect('pos:print_receipt', order_id=order.id)
+        method = request.POST.get('payment_method')
+        method_label = method if method in dict(Payment.PAYMENT_METHODS) else 'invalid'
+        try:
+            with metrics.payment_seconds.time():
+                payment = checkout(
+                    order_id,
+                    method=method,
+                    amount=request.POST.get('amount', '0'),
+                    reference_number=request.POST.get('reference_number', ''),
+                    user=request.user
+                )
+        except (CheckoutError, InvalidOperation) as e:
+            metrics.payments.inc(method=method_label, outcome='rejected')
+            messages.error(request, str(e) if isinstance(e, CheckoutError) else 'Invalid payment amount!')
         else:
-            messages.error(request, 'Payment amount is insufficient!')
+            metrics.payments.inc(method=method_label, outcome='paid')
+            messages.success(request, f'Payment processed successfully for order {payment.order.order_number}!')
+            return redirect('pos:print_receipt', order_id=order_id)
     
     return redirect('pos:billing', order_id=order_id)
 
 
+@staff_member_required
+def day_close(request):
+    """End-of-day close: preview a day's figures, then freeze them"""
+    date = parse_date(request.GET.get('date') or '') or timezone.localdate()
+    
+    if request.method == 'POST':
+        try:
+            close_day(date, request.user)
+            messages.success(request, f'{date} closed.')
+        except CloseError as e:
+            messages.error(request, str(e))
+        return redirect(f"{reverse('pos:day_close')}?date={date.isoformat()}")
+    
+    closed, report = day_report(date)
+    
+    context = {
+        'date': date,
+        'closed': closed,
+        'report': report,
+        'previous_day': date - timedelta(days=1),
+        'next_day': date + timedelta(days=1),
+        'recent_closes': DayClose.objects.only('date', 'orders', 'sales', 'mismatches')[:14],
+    }
+    
+    return render(request, 'pos/day_close.html', context)
+
+
+@staff_member_required
+def print_z_report(request):
+    """Printable Z-report; a day that is still open prints as an interim X-report"""
+    date = parse_date(request.GET.get('date') or '') or timezone.localdate()
+    closed, report = day_report(date)
+    
+    return render(request, 'pos/z_report.html', {'date': date, 'closed': closed, 'report': report})
+
+
 @login_required
+@order_conditional
 def print_receipt(request, order_id):
     """Generate receipt for printing"""
     order = get_object_or_404(Order, id=order_id)
@@ -370,28 +630,183 @@ def print_receipt(request, order_id):
     return render(request, 'pos/receipt.html', context)
 
 
-# AJAX API endpoints
 @login_required
-def get_menu_items(request):
+def select_location(request):
+    """Remember which restaurant location this device belongs to"""
+    next_url = request.POST.get('next')
+    if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+        next_url = 'pos:dashboard'
+    response = redirect(next_url)
+    code = request.POST.get('location')
+    
+    if request.method == 'POST' and code in get_locations():
+        response.set_cookie(LOCATION_COOKIE, code, max_age=365 * 24 * 60 * 60, samesite='Lax')
+    
+    return response
+
+
+@staff_member_required
+def location_report(request):
+    """Sales across all locations for a day"""
+    date = timezone.now().date()
+    if request.GET.get('date'):
+        try:
+            date = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+        except ValueError:
+            messages.error(request, 'Invalid date, showing today instead.')
+    
+    rows, totals = sales_by_location(date)
+    
+    context = {
+        'date': date,
+        'rows': rows,
+        'totals': totals,
+    }
+    
+    return render(request, 'pos/location_report.html', context)
+
+
+@staff_member_required
+def sales_report(request):
+    """Daily sales built from the order event log"""
+    # Rollups are refreshed in the background; show what is built so far
+    queue_rollup_update()
+    rollups = DailySalesRollup.objects.all()[:30]
+    
+    return render(request, 'pos/sales_report.html', {'rollups': rollups})
+
+
+@login_required
+def reservation_list(request):
+    """A day's bookings and a search for free tables"""
+    today = timezone.localdate()
+    search = ReservationSearchForm(request.GET or None, initial={'date': today})
+    available_for = None
+    if search.is_valid():
+        start, end = search.slot()
+        available_for = list(available_tables(search.cleaned_data['party_size'], start, end))
+    
+    day = parse_date(request.GET.get('day') or '') or (
+        search.cleaned_data['date'] if search.is_valid() else today
+    )
+    day_start = timezone.make_aware(datetime.combine(day, time.min))
+    reservations = Reservation.objects.filter(
+        start__gte=day_start,
+        start__lt=day_start + timedelta(days=1)
+    ).select_related('table')
+    
+    context = {
+        'search': search,
+        'available_tables': available_for,
+        'reservations': reservations,
+        'day': day,
+        'previous_day': day - timedelta(days=1),
+        'next_day': day + timedelta(days=1),
+    }
+    
+    return render(request, 'pos/reservations.html', context)
+
+
+@login_required
+def book_reservation(request):
+    """Book a table found by the availability search"""
+    day = None
+    if request.method == 'POST':
+        form = ReservationForm(request.POST)
+        if form.is_valid():
+            start, end = form.slot()
+            day = form.cleaned_data['date']
+            try:
+                reservation = book(
+                    form.cleaned_data['table'].id,
+                    form.cleaned_data['party_size'],
+                    start,
+                    end,
+                    customer_name=form.cleaned_data['customer_name'],
+                    phone=form.cleaned_data['phone'],
+                    notes=form.cleaned_data['notes'],
+                    user=request.user
+                )
+                messages.success(
+                    request,
+                    f'Table {form.cleaned_data["table"].number} booked for {reservation.customer_name} '
+                    f'at {timezone.localtime(start):%H:%M}!'
+                )
+            except ReservationError as e:
+                messages.error(request, str(e))
+        else:
+            messages.error(request, 'Please check the booking details.')
+    
+    url = reverse('pos:reservation_list')
+    return redirect(f'{url}?day={day.isoformat()}' if day else url)
+
+
+@login_required
+def update_reservation(request, reservation_id):
+    """Seat, cancel or mark a booking as a no-show"""
+    reservation = get_object_or_404(Reservation, id=reservation_id)
+    day = timezone.localtime(reservation.start).date()
+    
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        try:
+            if action == 'seat':
+                order = seat(reservation.id, user=request.user)
+                metrics.orders_created.inc()
+                messages.success(request, f'{reservation.customer_name} seated, order {order.order_number} opened!')
+                return redirect('pos:order_detail', order_id=order.id)
+            if action in ('cancelled', 'no_show'):
+                cancel(reservation.id, status=action)
+                messages.success(request, f'Reservation for {reservation.customer_name} updated!')
+        except ReservationError as e:
+            messages.error(request, str(e))
+    
+    return redirect(f'{reverse("pos:reservation_list")}?day={day.isoformat()}')
+
+
+def metrics_view(request):
+    """Prometheus metrics for staff or for scrapers presenting METRICS_TOKEN"""
+    token = settings.POS_SETTINGS.get('METRICS_TOKEN', '')
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    allowed = request.user.is_staff or (
+        token and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
+    )
+    if not allowed:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# AJAX API endpoints
+@async_support.login_required
+async def get_menu_items(request):
     """Get menu items by category (AJAX)"""
     category_id = request.GET.get('category_id')
+    if category_id and not category_id.isdigit():
+        return JsonResponse({'menu_items': []})
+    
+    def load():
+        if category_id:
+            menu_items = MenuItem.objects.filter(
+                category_id=category_id,
+                is_available=True
+            ).values('id', 'name', 'price', 'description')
+        else:
+            menu_items = MenuItem.objects.filter(
+                is_available=True
+            ).values('id', 'name', 'price', 'description', 'category__name')
+        return list(menu_items)
     
-    if category_id:
-        menu_items = MenuItem.objects.filter(
-            category_id=category_id,
-            is_available=True
-        ).values('id', 'name', 'price', 'description')
-    else:
-        menu_items = MenuItem.objects.filter(
-            is_available=True
-        ).values('id', 'name', 'price', 'description', 'category__name')
+    menu_items = await aget_or_compute(f'menu_items:{category_id or "all"}', load, groups=('menu',))
+    sold_out = await sync_to_async(sold_out_ids)()
+    menu_items = [item for item in menu_items if item['id'] not in sold_out]
     
-    return JsonResponse({'menu_items': list(menu_items)})
+    return JsonResponse({'menu_items': menu_items})
 
 
-@csrf_exempt
-@login_required
-def add_item_to_order(request):
+@async_support.csrf_exempt
+@async_support.login_required
+async def add_item_to_order(request):
     """Add item to order (AJAX)"""
     if request.method == 'POST':
         try:
@@ -401,52 +816,139 @@ def add_item_to_order(request):
             quantity = int(data.get('quantity', 1))
             special_instructions = data.get('special_instructions', '')
             
-            order = get_object_or_404(Order, id=order_id)
-            menu_item = get_object_or_404(MenuItem, id=menu_item_id)
+            order = await aget_object_or_404(Order, id=order_id)
+            menu_item = await aget_object_or_404(MenuItem, id=menu_item_id)
             
-            # Check if item already exists in order
-            order_item, created = OrderItem.objects.get_or_create(
-                order=order,
-                menu_item=menu_item,
-                defaults={
-                    'quantity': quantity,
-                    'unit_price': menu_item.price,
-                    'special_instructions': special_instructions
-                }
-            )
+            def apply():
+                # Reserves stock, adds or increments the item, recalculates totals
+                add_item(order, menu_item, quantity, special_instructions)
+                return build_order_state(order.id)
             
-            if not created:
-                # Update existing item
-                order_item.quantity += quantity
-                if special_instructions:
-                    order_item.special_instructions = special_instructions
-                order_item.save()
+            state = await sync_to_async(apply)()
+            metrics.items_added.inc(quantity)
             
-            # Recalculate order totals
-            order.calculate_totals()
-            
-            return JsonResponse({
-                'success': True,
-                'item_total': float(order_item.get_total()),
-                'order_subtotal': float(order.subtotal),
-                'order_tax': float(order.tax_amount),
-                'order_total': float(order.total)
-            })
+            return order_state_response(state, success=True)
             
+        except OutOfStock as e:
+            metrics.add_item_failures.inc(reason='out_of_stock')
+            return JsonResponse({'success': False, 'error': str(e)})
         except Exception as e:
+            metrics.add_item_failures.inc(reason=type(e).__name__)
             return JsonResponse({'success': False, 'error': str(e)})
     
     return JsonResponse({'success': False})
 
 
-@login_required
-def get_order_totals(request, order_id):
+@async_support.login_required
+@async_order_conditional
+async def get_order_totals(request, order_id):
     """Get order totals (AJAX)"""
-    order = get_object_or_404(Order, id=order_id)
-    order.calculate_totals()
+    order = await aget_object_or_404(Order, id=order_id)
+    await sync_to_async(order.calculate_totals)()
     
     return JsonResponse({
         'subtotal': float(order.subtotal),
         'tax': float(order.tax_amount),
         'total': float(order.total)
-    })
\ No newline at end of file
+    })
+
+
+@async_support.login_required
+async def sync_operations(request):
+    """Apply a batch of operations queued by a terminal, each at most once (AJAX)"""
+    if request.method != 'POST':
+        return JsonResponse({'success': False}, status=405)
+    try:
+        operations = json.loads(request.body)['operations']
+    except (ValueError, KeyError, TypeError):
+        operations = None
+    if not isinstance(operations, list) or len(operations) > MAX_BATCH:
+        return JsonResponse({'success': False, 'error': f'Send up to {MAX_BATCH} operations as a list'}, status=400)
+    
+    def apply():
+        results = apply_batch(operations)
+        # Fresh state of every order touched, so the terminal can redraw it
+        order_ids = {result['order_id'] for result in results if result.get('order_id')}
+        return results, {order_id: build_order_state(order_id) for order_id in order_ids}
+    
+    results, orders = await sync_to_async(apply)()
+    
+    return JsonResponse(
+        {'success': True, 'results': results, 'orders': orders},
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+
+@login_required
+@order_conditional
+def get_order_state(request, order_id):
+    """Current items, totals and status of an order (AJAX)"""
+    state = build_order_state(order_id)
+    if state is None:
+        return JsonResponse({'error': 'Order not found'}, status=404)
+    
+    return order_state_response(state)
+
+
+@login_required
+def get_table_availability(request):
+    """Tables free for a party size and slot (AJAX)"""
+    search = ReservationSearchForm(request.GET)
+    if not search.is_valid():
+        return JsonResponse({'success': False, 'errors': search.errors}, status=400)
+    
+    start, end = search.slot()
+    tables = available_tables(search.cleaned_data['party_size'], start, end).values('id', 'number', 'seats')
+    
+    return JsonResponse({'success': True, 'start': start, 'end': end, 'tables': list(tables)})
+
+
+@login_required
+def suggest_tables(request):
+    """Best-fit free tables for a party seated now (AJAX)"""
+    party_size = request.GET.get('party_size', '')
+    if not party_size.isdigit() or int(party_size) < 1:
+        return JsonResponse({'success': False, 'error': 'party_size must be a positive number'}, status=400)
+    
+    suggestions = suggest(int(party_size))
+    
+    return JsonResponse({'success': True, 'suggestions': [allocation.as_dict() for allocation in suggestions]})
+
+
+@staff_member_required
+def get_order_events(request):
+    """Order events after a given id, for change-feed consumers (AJAX)"""
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = min(int(request.GET.get('limit', 500)), 1000)
+    except ValueError:
+        return JsonResponse({'error': 'after and limit must be integers'}, status=400)
+    
+    events = stream(after, limit)
+    
+    return JsonResponse({
+        'events': [
+            {
+                'id': event.id,
+                'type': event.event_type,
+                'order_id': event.order_id,
+                'table_id': event.table_id,
+                'data': event.data,
+                'created_at': event.created_at,
+            }
+            for event in events
+        ],
+        'last_id': events[-1].id if events else after,
+    })
+
+
+@staff_member_required
+def get_task_metrics(request):
+    """Background task queue metrics (AJAX)"""
+    return JsonResponse(queue_metrics())
+
+
+@staff_member_required
+def get_cache_metrics(request):
+    """Cache hit/miss counters for this process (AJAX)"""
+    return JsonResponse(cache_metrics())
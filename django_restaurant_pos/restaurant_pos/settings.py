@@ -34,12 +34,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pos.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'pos.locations.LocationMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -56,12 +58,14 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'pos.locations.location_context',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'restaurant_pos.wsgi.application'
+ASGI_APPLICATION = 'restaurant_pos.asgi.application'
 
 
 # Database
@@ -74,6 +78,35 @@ DATABASES = {
     }
 }
 
+# Restaurant locations served by this deployment. Each location keeps its
+# orders, order items, payments and tables in its own database alias; users
+# (and the menu, if shared) stay in 'default' and are mirrored out. To add a
+# location, add a DATABASES entry, list it here, then run
+# `python manage.py migrate --database=<alias>` and `python manage.py sync_locations`.
+POS_LOCATIONS = {
+    'main': {'NAME': 'Main', 'DATABASE': 'default'},
+    # 'downtown': {'NAME': 'Downtown', 'DATABASE': 'downtown'},
+}
+
+DATABASE_ROUTERS = ['pos.routers.LocationRouter']
+
+
+# Caches: a per-process memory tier in front of a tier shared by all
+# processes (see pos/cache.py). The file cache needs no extra service; for a
+# Redis (or Redis-protocol server) shared tier use
+# 'django.core.cache.backends.redis.RedisCache' with LOCATION 'redis://127.0.0.1:6379'.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'pos-local',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -129,4 +162,17 @@ POS_SETTINGS = {
     'TAX_RATE': 0.08,  # 8% tax rate
     'CURRENCY': '$',
     'RESTAURANT_NAME': 'Restaurant POS',
+    'DEFAULT_LOCATION': 'main',
+    'SHARED_MENU': True,  # One menu for all locations
+    'CACHE_TTL': 10,  # Seconds hot views may serve cached data
+    'STOCK_SHARDS': 4,  # Rows each tracked item's stock is split over
+    'RESERVATION_DEFAULT_MINUTES': 90,
+    'RESERVATION_MAX_MINUTES': 240,  # Longest booking allowed
+    'RESERVATION_TURN_MINUTES': 15,  # Time to clear and reset a table between bookings
+    'RESERVATION_HOLD_MINUTES': 30,  # Mark a table reserved this long before a booking
+    'RESERVATION_GRACE_MINUTES': 15,  # Release the table if the party is this late
+    'COMBINE_MAX_TABLES': 2,  # Adjacent tables that may be pushed together for one party
+    'METRICS_DIR': BASE_DIR / 'metrics',  # Per-process metric files merged by /metrics/
+    'METRICS_TOKEN': '',  # Bearer token letting Prometheus scrape /metrics/ without logging in
+    'SYNC_KEY_HOURS': 72,  # How long a terminal may take to resend a queued operation
 }
\ No newline at end of file